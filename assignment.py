@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Назначение дронов на цели с минимальной суммарной стоимостью.
+
+Венгерский алгоритм с потенциалами, O(n^2 * m) для n дронов и m целей:
+на команду из пяти дронов и десяток источников это десятки микросекунд,
+зато решение оптимально для всех дронов сразу, а не для каждого по очереди.
+"""
+import math
+
+FORBIDDEN = float('inf')  # стоимость запрещенного назначения
+
+
+def min_cost_assignment(costs):
+    """
+    Назначить строки столбцам так, чтобы сумма стоимостей была минимальной.
+
+    :param costs: матрица n x m (список списков или массив NumPy), FORBIDDEN - назначать нельзя
+    :return: для каждой строки индекс столбца или None, если строке ничего не досталось
+    """
+    costs = [list(row) for row in (costs.tolist() if hasattr(costs, 'tolist') else costs)]
+    rows = len(costs)
+    columns = len(costs[0]) if rows else 0
+    if not rows or not columns:
+        return [None] * rows
+    if rows > columns:
+        transposed = _solve([list(column) for column in zip(*costs)])
+        result = [None] * rows
+        for column, row in enumerate(transposed):
+            if row is not None:
+                result[row] = column
+        return result
+    return _solve(costs)
+
+
+def _solve(costs):
+    """Венгерский алгоритм для n <= m, индексы в нем с единицы"""
+    rows, columns = len(costs), len(costs[0])
+    finite = [cost for row in costs for cost in row if not math.isinf(cost)]
+    # запрещенные назначения дороже любого допустимого набора, чтобы выбирались в последнюю очередь
+    big = (max(finite) - min(finite) + 1) * (rows + 1) + max(finite) if finite else 1.0
+    matrix = [[big if math.isinf(cost) else cost for cost in row] for row in costs]
+
+    u = [0.0] * (rows + 1)
+    v = [0.0] * (columns + 1)
+    owner = [0] * (columns + 1)  # owner[j] - строка, назначенная столбцу j
+    way = [0] * (columns + 1)
+    for row in range(1, rows + 1):
+        owner[0] = row
+        column = 0
+        slack = [math.inf] * (columns + 1)
+        used = [False] * (columns + 1)
+        while owner[column]:
+            used[column] = True
+            current = owner[column]
+            delta, following = math.inf, 0
+            cost_row = matrix[current - 1]
+            for j in range(1, columns + 1):
+                if not used[j]:
+                    reduced = cost_row[j - 1] - u[current] - v[j]
+                    if reduced < slack[j]:
+                        slack[j], way[j] = reduced, column
+                    if slack[j] < delta:
+                        delta, following = slack[j], j
+            for j in range(columns + 1):
+                if used[j]:
+                    u[owner[j]] += delta
+                    v[j] -= delta
+                else:
+                    slack[j] -= delta
+            column = following
+        while column:
+            previous = way[column]
+            owner[column] = owner[previous]
+            column = previous
+
+    result = [None] * rows
+    for column in range(1, columns + 1):
+        row = owner[column]
+        if row and not math.isinf(costs[row - 1][column - 1]):
+            result[row - 1] = column - 1
+    return result
@@ -30,14 +30,14 @@ class AttackPlan:
     def go_to_attack_position(self, soldier):
         """Отправка дрона на позицию для атаки"""
         if self.attack_positions:
-            index = soldier.__class__.fighters.index(soldier)
+            index = soldier.roster.fighters.index(soldier) % len(self.attack_positions)
             soldier.target = self.attack_positions[index]
             soldier.move_at(soldier.target)
 
     def go_to_defense_position(self, soldier):
         """Отправка дрона на позицию для обороны"""
         if self.defense_positions:
-            index = soldier.__class__.guardians.index(soldier)
+            index = soldier.roster.guardians.index(soldier) % len(self.defense_positions)
             soldier.target = self.defense_positions[index]
             soldier.move_at(soldier.target)
 
@@ -97,6 +97,8 @@ class AttackPlan:
 
     def advance_to_next_position(self):
         """продолжение наступления"""
+        if self.advance_distance is None:
+            return  # наступление не начато: нет цели, некуда продвигаться
         self.attack_stage += 1
         self.create_attack_positions()
 
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Микробенчмарки горячих мест ИИ на синтетических сценах FakeScene.
+
+    python benchmarks.py --size 5x17 --size 20x200 --save bench_baseline.json
+    python benchmarks.py --size 5x17 --size 20x200 --compare bench_baseline.json --threshold 0.15
+"""
+import argparse
+import json
+import random
+import sys
+import time
+
+from robogame_engine.geometry import Point
+from robogame_engine.theme import theme
+
+from fake_scene import FakeScene
+from pestov import PestovDrone
+from roles import SUFFICIENT_PAYLOAD, Fighter, Harvester
+from routes import plan_route
+from stage_03_harvesters.driller import DrillerDrone
+from stage_03_harvesters.reaper import ReaperDrone
+from stage_04_soldiers.devastator import DevastatorDrone
+
+TEAMS = (PestovDrone, ReaperDrone, DrillerDrone, DevastatorDrone)
+WARMUP_TICKS = 30
+SCATTER_MARGIN = 300  # дронов не ставим рядом с базами
+MIN_TIME = 0.2  # секунд на один повтор замера
+REPEATS = 3
+
+
+class BenchScene:
+    """Синтетическая сцена заданного размера и дроны, на которых меряем"""
+
+    def __init__(self, drones, asteroids, seed=0):
+        self.size = '{}x{}'.format(drones, asteroids)
+        self.scene = FakeScene(field=(1200, 900), asteroids_count=asteroids, can_fight=True, seed=seed,
+                                strict=False)
+        for drone_class in TEAMS:
+            self.scene.add_team(drone_class, drones)
+        self.scene.prepare()
+        for drone in self.scene.drones:  # разбросаем дронов по полю, как в середине игры
+            drone.coord = self.random_point()
+        self.scene.run(WARMUP_TICKS)
+
+        self.pestov = self.first_alive(PestovDrone)
+        self.reaper = self.first_alive(ReaperDrone)
+        self.devastator = self.first_alive(DevastatorDrone)
+        self.harvester = Harvester(self.pestov)
+        self.fighter = Fighter(self.pestov)
+        self.route_candidates = self.harvester.get_route_candidates()
+        self.enemy = self.first_alive(ReaperDrone)
+
+        pathfind = self.reaper.pathfind
+        pathfind.update_units(func=lambda u: not u.cargo.is_empty)
+        pathfind.calc_weights(kernel=self.reaper._strategy.weight_harvest_kernel)
+        self.fat_source = self.reaper._strategy.get_harvest_source() or pathfind.points[-1]
+
+    def random_point(self):
+        while True:
+            point = Point(random.uniform(0, theme.FIELD_WIDTH), random.uniform(0, theme.FIELD_HEIGHT))
+            if all(base.distance_to(point) > SCATTER_MARGIN for base in self.scene.motherships):
+                return point
+
+    def first_alive(self, drone_class):
+        return next(drone for drone in self.scene.drones if isinstance(drone, drone_class) and drone.is_alive)
+
+    def cases(self):
+        """Имя замера и функция без аргументов"""
+        pathfind = self.reaper.pathfind
+        strategy = self.reaper._strategy
+        headquarters = self.devastator.headquarters
+        point = Point(theme.FIELD_WIDTH / 2, theme.FIELD_HEIGHT / 2)
+        return [
+            ('Dijkstra.calc_weights', lambda: pathfind.calc_weights(kernel=strategy.weight_harvest_kernel)),
+            ('Dijkstra.find_path', lambda: pathfind.find_path(self.reaper.mothership, self.fat_source,
+                                                              as_objects=True)),
+            ('Dijkstra.shortest_path', lambda: pathfind.shortest_path(self.reaper.mothership, self.fat_source,
+                                                                      as_objects=True, direct=False)),
+            ('Harvester.get_distances', self.harvester.get_distances),
+            ('Harvester.get_route_candidates', self.harvester.get_route_candidates),
+            ('plan_route', lambda: plan_route(self.pestov, self.pestov.my_mothership, self.route_candidates,
+                                              SUFFICIENT_PAYLOAD)),
+            ('Fighter.check_for_enemy_drones', self.fighter.check_for_enemy_drones),
+            ('Headquarters.get_enemies', lambda: headquarters.get_enemies(self.devastator)),
+            ('Headquarters.get_place_for_attack', lambda: headquarters.get_place_for_attack(self.devastator,
+                                                                                            self.enemy)),
+            ('DevastatorDrone.valide_place', lambda: self.devastator.valide_place(point)),
+            ('DroneState.sources', self.reaper.fsm_state.sources),
+            # меняет цели харвестеров, поэтому последним
+            ('Harvester.assign_sources', self.harvester.assign_sources),
+        ]
+
+
+def measure(func, min_time=MIN_TIME, repeats=REPEATS):
+    """Лучшее из repeats время одного вызова, в секундах"""
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time / 10:
+            break
+        number *= 10
+    number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+    best = float('inf')
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - started) / number)
+    return best
+
+
+def run(sizes, seed=0, min_time=MIN_TIME):
+    """Замеры для каждого размера сцены: {'имя[размер]': секунд на вызов}"""
+    results = {}
+    for drones, asteroids in sizes:
+        bench = BenchScene(drones, asteroids, seed=seed)
+        for name, func in bench.cases():
+            random.seed(seed)
+            results['{}[{}]'.format(name, bench.size)] = measure(func, min_time=min_time)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Замеры, ставшие медленнее базовых больше чем на threshold"""
+    regressions = []
+    for name, seconds in sorted(results.items()):
+        base = baseline.get(name)
+        if base and seconds > base * (1.0 + threshold):
+            regressions.append((name, base, seconds))
+    return regressions
+
+
+def parse_size(value):
+    drones, asteroids = value.lower().split('x')
+    return int(drones), int(asteroids)
+
+
+def format_results(results, baseline=None):
+    lines = []
+    for name, seconds in sorted(results.items()):
+        line = '{:<55}{:>12.2f} us'.format(name, seconds * 1e6)
+        if baseline and baseline.get(name):
+            line += '{:>+10.1f}%'.format((seconds / baseline[name] - 1.0) * 100)
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Микробенчмарки ИИ дронов')
+    parser.add_argument('--size', action='append', type=parse_size,
+                        help='дронов в команде x астероидов, например 5x17; можно несколько')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--min-time', type=float, default=MIN_TIME)
+    parser.add_argument('--save', help='записать результаты в JSON как базовые')
+    parser.add_argument('--compare', help='сравнить с базовыми результатами из JSON')
+    parser.add_argument('--threshold', type=float, default=0.1, help='допустимое замедление, доля')
+    args = parser.parse_args()
+
+    results = run(args.size or [(5, 17)], seed=args.seed, min_time=args.min_time)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+    print(format_results(results, baseline))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(dict(seed=args.seed, results=results), f, indent=2, sort_keys=True)
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        for name, base, seconds in regressions:
+            print('REGRESSION {}: {:.2f} us -> {:.2f} us'.format(name, base * 1e6, seconds * 1e6))
+        sys.exit(1 if regressions else 0)
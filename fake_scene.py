@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+"""
+Легковесная замена SpaceField для бенчмарков и стресс-тестов ИИ дронов.
+
+Реализует только то, чем пользуется код команд: scene.drones/asteroids/motherships,
+distance_to, move_at, load_from, unload_to, gun.shot, cargo и константы theme.
+Движение - по прямой с постоянной скоростью, поворот мгновенный, выстрел попадает
+сразу в первую цель на линии огня. Ни UI-процесса, ни очередей команд движка.
+
+    scene = FakeScene(field=(1200, 900), asteroids_count=17)
+    scene.add_team(PestovDrone, 5)
+    scene.add_team(ReaperDrone, 5)
+    scene.prepare()
+    scene.run(1000)
+"""
+import itertools
+import math
+import random
+from collections import Counter, OrderedDict, deque
+
+from astrobox.cargo import Cargo
+from astrobox.core import Asteroid, Drone, EventWakeUp, MotherShip
+from astrobox.guns import PlasmaGun
+from robogame_engine import GameObject
+from robogame_engine.events import EventBorned, EventStopped, EventStoppedAtTargetPoint
+from robogame_engine.geometry import Point, Vector
+from robogame_engine.theme import theme
+
+from shared_state import reset_shared_state
+
+THEME_MODULE = 'astrobox.themes.default'
+
+
+class FakeGun(PlasmaGun):
+    """Пушка без снарядов: попадание в первую цель на линии огня в тот же тик"""
+
+    def shot(self, target):
+        if not self._owner.is_alive:
+            return
+        if not theme.DRONES_CAN_FIGHT or not self.can_shot:
+            return
+        self._cooldown = theme.PLASMAGUN_COOLDOWN_TIME
+        victim = self.first_on_line_of_fire()
+        if victim is not None:
+            victim.damage_taken(theme.PROJECTILE_DAMAGE)
+
+    def first_on_line_of_fire(self):
+        owner = self._owner
+        direction = Vector.to_radian(owner.direction)
+        dx, dy = math.cos(direction), math.sin(direction)
+        victim, victim_distance = None, self.shot_distance
+        for unit in owner.scene.drones + owner.scene.motherships:
+            if unit is owner or not unit.is_alive:
+                continue
+            ux, uy = unit.x - owner.x, unit.y - owner.y
+            along = ux * dx + uy * dy
+            if along < 0 or along > victim_distance:
+                continue
+            if abs(ux * dy - uy * dx) <= unit.radius + self.projectile.radius:
+                victim, victim_distance = unit, along
+        return victim
+
+
+class FakeUnit:
+    """Общая инициализация объектов без машинерии GameObject.__init__"""
+
+    def _init_unit(self, coord, payload=0, max_payload=1, direction=None):
+        self.coord = coord
+        self.radius = self.__class__.radius
+        self.id = self.scene.next_id()
+        self.vector = Vector.from_direction(random.randint(0, 360) if direction is None else direction, module=1)
+        self.target = None
+        self._move_target = None
+        self._cargo = Cargo(self, payload=payload, max_payload=max_payload)
+        self._transition = None
+        self._selected = False
+
+
+class FakeAsteroid(FakeUnit, Asteroid):
+
+    def __init__(self, coord, elerium):
+        self._init_unit(coord, payload=elerium, max_payload=elerium)
+        self._size = (elerium / theme.MIN_ASTEROID_ELERIUM) * .8
+
+    def game_step(self):
+        pass
+
+
+class FakeMotherShip(FakeUnit, MotherShip):
+
+    def __init__(self, coord, max_payload, team):
+        self._init_unit(coord, max_payload=max_payload)
+        self._MotherShip__health = theme.MOTHERSHIP_MAX_SHIELD
+        self._MotherShip__death_animaion = None
+        self.set_team(team)
+
+
+class FakeDrone(FakeUnit, Drone):
+    """
+    Кинематика дрона.
+
+    Класс команды подмешивается перед ним (см. fake_drone_class), поэтому super()
+    из game_step/move_at команды попадает сюда, а не в astrobox.core.Drone.
+    """
+
+    def __init__(self, **kwargs):
+        self._init_unit(Point(0, 0), max_payload=theme.MAX_DRONE_ELERIUM)
+        self._mothership = None
+        self._gun = FakeGun(self) if theme.DRONES_CAN_FIGHT else None
+        self._Drone__health = theme.DRONE_MAX_SHIELD
+        self._events = deque()
+        self._move_point = None
+        self._sleep_countdown = theme.SLEEP_COUNTDOWN
+        self.set_team(self.scene.team_of(self.__class__))
+        self.scene.add_object(self)
+        self.add_event(EventBorned(self))
+
+    @property
+    def is_moving(self):
+        return self._move_point is not None
+
+    def add_event(self, event):
+        self._events.append(event)
+
+    def proceed_events(self):
+        while self._events:
+            event = self._events.popleft()
+            try:
+                event.handle(obj=self)
+            except Exception as exc:
+                self.error("Exception at {} event {} handle: {}".format(self, event, exc))
+
+    def proceed_commands(self):
+        pass
+
+    def move_at(self, target, speed=None):
+        if not self.is_alive or self._move_target == target:
+            return
+        self._move_target = target
+        self._move_point = target.coord if isinstance(target, GameObject) else target
+        self.vector = Vector.from_points(self.coord, self._move_point, module=1) if self.distance_to(
+            self._move_point) else self.vector
+
+    def turn_to(self, target, speed=None):
+        if not self.is_alive:
+            return
+        if isinstance(target, (int, float)):
+            self.vector = Vector.from_direction(target, module=1)
+            return
+        point = target.coord if isinstance(target, GameObject) else target
+        if self.distance_to(point):
+            self.vector = Vector.from_points(self.coord, point, module=1)
+
+    def stop(self):
+        self._move_point = None
+        self.add_event(EventStopped())
+
+    def game_step(self):
+        if not self.is_alive:
+            return
+        if self.mothership.is_alive and self.distance_to(self.mothership) < theme.MOTHERSHIP_HEALING_DISTANCE:
+            self._Drone__heal_taken(theme.MOTHERSHIP_HEALING_RATE)
+        else:
+            self._Drone__heal_taken(theme.DRONE_SHIELD_RENEWAL_RATE)
+        if self.have_gun:
+            self.gun.game_step()
+        if self._transition:
+            if not self._transition.is_finished:
+                self._transition.game_step()
+            if self._transition.is_finished:
+                if self._transition.cargo_to == self._cargo:
+                    self.on_load_complete()
+                if self._transition.cargo_from == self._cargo:
+                    self.on_unload_complete()
+                self._transition = None
+        if self._move_point is not None:
+            self._move()
+            self._sleep_countdown = theme.SLEEP_COUNTDOWN
+        elif self._transition is None:
+            self._sleep_countdown -= 1
+            if self._sleep_countdown <= 0:
+                self._sleep_countdown = theme.SLEEP_COUNTDOWN
+                self.add_event(EventWakeUp())
+
+    def _move(self):
+        point = self._move_point
+        distance = self.distance_to(point)
+        if distance < theme.DRONE_SPEED:
+            self.coord.x, self.coord.y = point.x, point.y
+            self._move_point = None
+            self.add_event(EventStoppedAtTargetPoint(point))
+            return
+        self.vector = Vector.from_points(self.coord, point, module=1)
+        self.coord.x += self.vector.x * theme.DRONE_SPEED
+        self.coord.y += self.vector.y * theme.DRONE_SPEED
+
+
+_fake_classes = {}
+
+
+def fake_drone_class(drone_class):
+    """Класс команды с подмешанной кинематикой FakeDrone"""
+    if drone_class not in _fake_classes:
+        _fake_classes[drone_class] = type('Fake' + drone_class.__name__, (drone_class, FakeDrone), {})
+    return _fake_classes[drone_class]
+
+
+class FakeScene:
+    """
+    Сцена с минимальным набором методов, к которым обращаются дроны.
+
+    При strict=False исключение в game_step дрона не прерывает прогон, а пишется
+    в лог и считается в errors по командам - код команд рассчитан на 5 дронов,
+    и на стресс-размерах отдельные места падают.
+    """
+    game_speed = 1
+    hold_state = False
+
+    def __init__(self, field=(1200, 900), asteroids_count=17, can_fight=True, seed=None, strict=True):
+        reset_shared_state()
+        if seed is not None:
+            random.seed(seed)
+        theme.set_theme_module(mod_path=THEME_MODULE)
+        theme.FIELD_WIDTH, theme.FIELD_HEIGHT = field
+        theme.DRONES_CAN_FIGHT = can_fight
+        self.field = field
+        self.asteroids_count = asteroids_count
+        self.strict = strict
+        self.errors = Counter()
+        self.objects = []
+        self._step = 0
+        self._ids = itertools.count(1)
+        self._teams = OrderedDict()
+        self._team_names = {}
+        self._drones = []
+        self._asteroids = []
+        self._motherships = OrderedDict()
+        GameObject.link_to_scene(scene=self, container=self.objects)
+
+    def next_id(self):
+        return next(self._ids)
+
+    def team_of(self, fake_class):
+        return self._team_names[fake_class]
+
+    def add_team(self, drone_class, count):
+        """Создание команды из count дронов класса drone_class"""
+        fake_class = fake_drone_class(drone_class)
+        self._team_names[fake_class] = drone_class.__name__
+        self._teams[drone_class.__name__] = []
+        return [fake_class() for _ in range(count)]
+
+    def add_object(self, obj):
+        self.objects.append(obj)
+        if isinstance(obj, Drone):
+            self._drones.append(obj)
+            self._teams[obj.team].append(obj)
+        elif isinstance(obj, Asteroid):
+            self._asteroids.append(obj)
+        elif isinstance(obj, MotherShip):
+            self._motherships[obj.team] = obj
+
+    def remove_object(self, obj):
+        if obj in self.objects:
+            self.objects.remove(obj)
+
+    def prepare(self):
+        """Расстановка астероидов, баз и дронов"""
+        margin = MotherShip.radius * 1.5
+        payloads = [random.randint(theme.MIN_ASTEROID_ELERIUM, theme.MAX_ASTEROID_ELERIUM)
+                    for _ in range(self.asteroids_count)]
+        for payload in payloads:
+            coord = Point(random.uniform(margin, theme.FIELD_WIDTH - margin),
+                          random.uniform(margin, theme.FIELD_HEIGHT - margin))
+            self.add_object(FakeAsteroid(coord=coord, elerium=payload))
+
+        max_elerium = max(round(sum(payloads), -2) + 100, 1000)
+        for number, team in enumerate(self._teams):
+            mothership = FakeMotherShip(coord=self._get_team_pos(number), max_payload=max_elerium, team=team)
+            self.add_object(mothership)
+            for drone in self._teams[team]:
+                drone.coord = mothership.coord.copy()
+
+    @staticmethod
+    def _get_team_pos(team_number):
+        radius = MotherShip.radius
+        if team_number == 0:
+            return Point(radius, radius)
+        elif team_number == 1:
+            return Point(theme.FIELD_WIDTH - radius, radius)
+        elif team_number == 2:
+            return Point(radius, theme.FIELD_HEIGHT - radius)
+        else:
+            return Point(theme.FIELD_WIDTH - radius, theme.FIELD_HEIGHT - radius)
+
+    def game_step(self):
+        self._step += 1
+        for drone in self._drones:
+            drone.proceed_events()
+            if self.strict:
+                drone.game_step()
+                continue
+            try:
+                drone.game_step()
+            except Exception as exc:
+                if not self.errors[drone.team]:
+                    drone.error("Exception at {} game_step: {!r}".format(drone, exc))
+                self.errors[drone.team] += 1
+        for mothership in self._motherships.values():
+            mothership.game_step()
+
+    def run(self, ticks):
+        for _ in range(ticks):
+            self.game_step()
+
+    # то, что дроны спрашивают у сцены
+    @property
+    def drones(self):
+        return list(self._drones)
+
+    @property
+    def asteroids(self):
+        return list(self._asteroids)
+
+    @property
+    def motherships(self):
+        return list(self._motherships.values())
+
+    @property
+    def teams(self):
+        return self._teams.copy()
+
+    @property
+    def teams_count(self):
+        return len(self._teams)
+
+    def get_mothership(self, team_name):
+        return self._motherships.get(team_name)
+
+    def get_team_number(self, team):
+        if team is None:
+            return None
+        return list(self._teams).index(team) + 1
+
+    def get_objects_by_type(self, cls=None, cls_name=None):
+        if cls:
+            return [obj for obj in self.objects if issubclass(obj.__class__, cls)]
+        return [obj for obj in self.objects if obj.__class__.__name__ == cls_name]
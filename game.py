@@ -5,15 +5,17 @@ from stage_04_soldiers.devastator import DevastatorDrone
 from pestov import PestovDrone
 
 NUMBER_OF_DRONES = 5
+TEAMS = (PestovDrone, ReaperDrone, DrillerDrone, DevastatorDrone)
+SCENE_SETTINGS = dict(
+    field=(1200, 900),
+    speed=5,
+    asteroids_count=17,
+    can_fight=True,
+)
 
 
 if __name__ == '__main__':
-    scene = SpaceField(
-        field=(1200, 900),
-        speed=5,
-        asteroids_count=17,
-        can_fight=True,
-    )
+    scene = SpaceField(**SCENE_SETTINGS)
 
     team_1 = [PestovDrone() for _ in range(NUMBER_OF_DRONES)]
     team_2 = [ReaperDrone() for _ in range(NUMBER_OF_DRONES)]
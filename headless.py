@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Прогон матча без отрисовки.
+
+Те же команды, что и в game.py, шагаются без UI-процесса и без пауз между тиками,
+с фиксированным seed и ограничением по количеству тиков.
+
+    python headless.py --preset game --seed 7 --max-ticks 5000
+"""
+import argparse
+import random
+import time
+from importlib import import_module
+
+from astrobox.guns import Projectile
+from astrobox.space_field import SpaceField
+
+from profiler import TickProfiler
+from shared_state import reset_shared_state
+
+PRESETS = {
+    'game': 'game',
+    'stage_03': 'stage_03_harvesters.game',
+    'stage_04': 'stage_04_soldiers.game',
+}
+MAX_TICKS = 17000  # после стольких тиков движок сам останавливает игру
+
+
+class TeamResult:
+    """Итоги одной команды"""
+
+    def __init__(self, team):
+        self.team = team
+        self.elerium = 0
+        self.kills = 0
+        self.alive = 0
+        self.dead = 0
+        self.mothership_alive = True
+
+    def as_dict(self):
+        return dict(team=self.team, elerium=self.elerium, kills=self.kills, alive=self.alive, dead=self.dead,
+                    mothership_alive=self.mothership_alive)
+
+
+class MatchResult:
+    """Итоги матча"""
+
+    def __init__(self, seed, steps, finished, teams, elapsed):
+        self.seed = seed
+        self.steps = steps
+        self.finished = finished  # игра закончилась по правилам движка, а не по лимиту тиков
+        self.teams = teams
+        self.elapsed = elapsed
+
+    @property
+    def winner(self):
+        """Команда, собравшая больше всего элериума"""
+        if self.teams:
+            return max(self.teams.values(), key=lambda result: result.elerium).team
+
+    @property
+    def ticks_per_second(self):
+        return self.steps / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return dict(seed=self.seed, steps=self.steps, finished=self.finished, elapsed=self.elapsed,
+                    winner=self.winner, teams={team: result.as_dict() for team, result in self.teams.items()})
+
+    def __str__(self):
+        lines = ['seed {}: {} steps{} in {:.1f}s ({:.0f} ticks/s)'.format(
+            self.seed, self.steps, '' if self.finished else ' (tick limit)', self.elapsed, self.ticks_per_second)]
+        for result in sorted(self.teams.values(), key=lambda result: -result.elerium):
+            lines.append('{:<20}:{:>6} elerium, kills {}, alive {}, dead {}{}'.format(
+                result.team, result.elerium, result.kills, result.alive, result.dead,
+                '' if result.mothership_alive else ' (was eliminated)'))
+        return '\n'.join(lines)
+
+
+def load_preset(name):
+    """Команды и настройки сцены из соответствующего game.py"""
+    module = import_module(PRESETS[name])
+    return module.TEAMS, dict(module.SCENE_SETTINGS)
+
+
+def find_killer(scene, drone):
+    """Команда, чей снаряд попал в дрона последним"""
+    for obj in scene.objects:
+        if isinstance(obj, Projectile) and obj.has_hit and obj.attached.target is drone:
+            return obj.owner.team
+
+
+def collect_results(scene, kills):
+    results = {}
+    for team, objects in scene.teams.items():
+        result = results[team] = TeamResult(team)
+        result.kills = kills.get(team, 0)
+        for drone in objects:
+            if drone.is_alive:
+                result.alive += 1
+                result.elerium += drone.payload
+            else:
+                result.dead += 1
+    for mothership in scene.motherships:
+        result = results[mothership.team]
+        result.mothership_alive = mothership.is_alive
+        if mothership.is_alive:
+            result.elerium += mothership.payload
+    return results
+
+
+def run_match(teams, seed=0, max_ticks=MAX_TICKS, number_of_drones=5, **settings):
+    """
+    Прогон одного матча без отрисовки.
+
+    :param teams: классы дронов, по команде на класс
+    :param seed: seed для random, от него зависит расстановка астероидов
+    :param max_ticks: ограничение по количеству тиков
+    :param number_of_drones: дронов в команде
+    :param settings: параметры SpaceField, как SCENE_SETTINGS в game.py
+    :return: MatchResult
+    """
+    reset_shared_state()
+    random.seed(seed)
+    settings['headless'] = True
+    scene = SpaceField(**settings)
+    for drone_class in teams:
+        for _ in range(number_of_drones):
+            drone_class()
+
+    started = time.perf_counter()
+    scene.prepare(**scene.init_kwargs)
+    scene._game_statistics_printed = True  # статистику отдаем в MatchResult, а не в stdout
+    kills = {}
+    dead = set()
+    finished = False
+    while scene._step < max_ticks:
+        finished, _ = scene.get_game_result()
+        if finished:
+            break
+        scene._step += 1
+        scene.game_step()
+        for drone in scene.drones:
+            if not drone.is_alive and drone.id not in dead:
+                dead.add(drone.id)
+                killer = find_killer(scene, drone)
+                if killer is not None and killer != drone.team:
+                    kills[killer] = kills.get(killer, 0) + 1
+    elapsed = time.perf_counter() - started
+
+    return MatchResult(seed=seed, steps=scene._step, finished=finished, teams=collect_results(scene, kills),
+                       elapsed=elapsed)
+
+
+def run_preset(name, seed=0, max_ticks=MAX_TICKS, number_of_drones=5):
+    teams, settings = load_preset(name)
+    return run_match(teams, seed=seed, max_ticks=max_ticks, number_of_drones=number_of_drones, **settings)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Прогон матча без отрисовки')
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='game')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-ticks', type=int, default=MAX_TICKS)
+    parser.add_argument('--drones', type=int, default=5)
+    parser.add_argument('--profile', action='store_true', help='замерить game_step каждой команды по тикам')
+    args = parser.parse_args()
+
+    if args.profile:
+        with TickProfiler() as profiler:
+            print(run_preset(args.preset, seed=args.seed, max_ticks=args.max_ticks, number_of_drones=args.drones))
+        print(profiler.report())
+    else:
+        print(run_preset(args.preset, seed=args.seed, max_ticks=args.max_ticks, number_of_drones=args.drones))
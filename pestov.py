@@ -1,14 +1,13 @@
 from math import ceil
 
-from astrobox.core import Drone, Asteroid
+from astrobox.core import Drone
 from robogame_engine.geometry import Point
 
 from attack_plan import AttackPlan
+from reservations import Reservations
 from roles import Fighter, Harvester, Guardian
-
-FIGHTER = 'fighter'
-HARVESTER = 'harvester'
-GUARDIAN = 'guardian'
+from roster import FIGHTER, GUARDIAN, HARVESTER, Roster
+from world import world_view
 
 
 class RoleError(Exception):
@@ -16,11 +15,8 @@ class RoleError(Exception):
 
 
 class PestovDrone(Drone):
-    my_team = []
-    fighters = []
-    harvesters = []
-    guardians = []
-    unavailable_asteroids = []
+    roster = Roster()
+    reservations = Reservations()
     attack_plan = None
 
     def __init__(self, **kwargs):
@@ -31,11 +27,12 @@ class PestovDrone(Drone):
         self.attacking = False
         self.previous_target = Point(self.x, self.y)
         self.next_target = None
+        self.route = []
 
     def on_born(self):
         """Действие при активации дрона"""
-        self.__class__.my_team.append(self)
-        if len(self.scene.motherships) == 4 and not self.__class__.harvesters:
+        self.roster.add(self)
+        if not self.have_gun or len(self.scene.motherships) == 4 and not self.roster.harvesters:
             self.change_role(HARVESTER)
         else:
             self.change_role(FIGHTER)
@@ -50,33 +47,29 @@ class PestovDrone(Drone):
 
     def change_role(self, role):
         """алгоритм смены роли"""
-        if role == 'fighter':
+        if role == FIGHTER:
             self.role = Fighter(self)
             self.offensive = True
             self.waiting = False
-            if self in self.__class__.harvesters:
-                self.__class__.harvesters.remove(self)
-            elif self in self.__class__.guardians:
-                self.__class__.guardians.remove(self)
-            self.__class__.fighters.append(self)
-        elif role == 'harvester':
+        elif role == HARVESTER:
             self.role = Harvester(self)
             self.offensive = False
             self.waiting = True
-            if self in self.__class__.fighters:
-                self.__class__.fighters.remove(self)
-            elif self in self.__class__.guardians:
-                self.__class__.guardians.remove(self)
-            self.__class__.harvesters.append(self)
-        elif role == 'guardian':
+        elif role == GUARDIAN:
             self.role = Guardian(self)
             self.offensive = False
             self.waiting = False
-            if self in self.__class__.harvesters:
-                self.__class__.harvesters.remove(self)
-            elif self in self.__class__.fighters:
-                self.__class__.fighters.remove(self)
-            self.__class__.guardians.append(self)
+        else:
+            return
+        if role != HARVESTER:
+            self.reservations.release_owner(self)
+        self.roster.set_role(self, role)
+
+    def damage_taken(self, damage=0):
+        super().damage_taken(damage)
+        if not self.is_alive:
+            self.roster.on_death(self)
+            self.reservations.release_owner(self)
 
     def on_stop_at_asteroid(self, asteroid):
         """Действие при встрече с астероидом"""
@@ -127,6 +120,8 @@ class PestovDrone(Drone):
         """Двигаться на базу"""
         self.target = self.my_mothership
         self.next_target = None
+        self.route = []
+        self.reservations.release_owner(self)
         self.move_at(self.target)
 
     def game_step(self):
@@ -135,16 +130,8 @@ class PestovDrone(Drone):
 
         if not self.is_alive:  # действие при смерти дрона
             self.role = None
-            if self in self.__class__.harvesters:
-                self.__class__.harvesters.remove(self)
-            elif self in self.__class__.fighters:
-                self.__class__.fighters.remove(self)
-            elif self in self.__class__.guardians:
-                self.__class__.guardians.remove(self)
-
-        for asteroid in self.asteroids:  # проверка, не опустели ли астероиды
-            if asteroid not in self.__class__.unavailable_asteroids and asteroid.is_empty:
-                self.__class__.unavailable_asteroids.append(asteroid)
+            self.roster.on_death(self)
+            self.reservations.release_owner(self)
 
         if self.health <= 50:  # переход в отступление
             self.retreat()
@@ -152,7 +139,7 @@ class PestovDrone(Drone):
         if isinstance(self.role, Harvester):  # действия для роли Harvester
 
             if self.waiting:
-                if len(self.asteroids) > len(self.__class__.unavailable_asteroids):
+                if self.role.has_available_asteroid():
                     self.waiting = False
                     self.try_to_depart()
 
@@ -160,8 +147,8 @@ class PestovDrone(Drone):
                 if mothership != self.my_mothership and self.near(mothership):
                     self.load_from(mothership)
 
-            for drone in self.scene.drones:
-                if drone not in self.my_team and self.near(drone) and not drone.is_alive:
+            for drone in world_view(self.scene).dead_drones:
+                if drone not in self.roster and self.near(drone):
                     self.load_from(drone)
 
             if self.count_dead() >= 3 and self.count_enemies() >= 5 - self.count_dead():
@@ -182,7 +169,7 @@ class PestovDrone(Drone):
                         self.check_for_enemy_drones() or self.check_target_base()):
                     self.attacking = True
 
-                for drone in self.__class__.fighters:
+                for drone in self.roster.fighters:
                     if self.target:
                         if drone.attacking or not self.near(self.target):
                             break
@@ -199,17 +186,17 @@ class PestovDrone(Drone):
                     self.move_to_mothership()
 
             if not self.attack_plan.target_mothership and all(
-                    [drone.health >= 80 for drone in self.__class__.fighters]):
+                    [drone.health >= 80 for drone in self.roster.fighters]):
                 for mothership in self.scene.motherships:
                     if mothership != self.my_mothership:
                         self.attack_plan.start_attack(mothership)
             elif self.attack_plan.target_mothership:
                 counter = 0
-                for drone in self.__class__.fighters:
+                for drone in self.roster.fighters:
                     if drone.offensive:
                         counter += 1
-                if counter < ceil(float(len(self.__class__.fighters)) / 2):
-                    self.attack_plan.abort_attack(self.__class__.fighters)
+                if counter < ceil(float(len(self.roster.fighters)) / 2):
+                    self.attack_plan.abort_attack(self.roster.fighters)
 
             if self.attacking:
                 self.attack_mode()
@@ -237,31 +224,15 @@ class PestovDrone(Drone):
 
     def count_enemies(self):
         """подсчет живых врагов"""
-        count = 0
-        for drone in self.scene.drones:
-            if drone not in self.__class__.my_team and drone.is_alive:
-                count += 1
-        return count
+        return self.roster.count_enemies(self)
 
     def count_dead(self):
         """подсчет потерь"""
-        count = 0
-        for drone in self.scene.drones:
-            if isinstance(drone, PestovDrone) and not drone.is_alive:
-                count += 1
-        return count
+        return self.roster.dead
 
     def enemies_alive(self):
         """Проверка, остались ли живые вражеские дроны"""
-        for drone in self.scene.drones:
-            if drone not in self.__class__.my_team and drone.is_alive:
-                return True
-        else:
-            for mothership in self.scene.motherships:
-                if mothership != self.my_mothership and mothership.is_alive:
-                    return True
-            else:
-                return False
+        return self.roster.enemies_alive(self)
 
     def attack_mode(self):
         """атака вражеских дронов или базы в радиусе поражения"""
@@ -289,6 +260,4 @@ class PestovDrone(Drone):
         self.previous_target = Point(self.x, self.y)
         self.offensive = False
         self.attacking = False
-        if isinstance(self.target, Asteroid) and self.target in self.__class__.unavailable_asteroids:
-            self.__class__.unavailable_asteroids.remove(self.target)
         self.move_to_mothership()
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Профилировщик game_step по тикам и командам.
+
+Подменяет game_step у PestovDrone и DroneUnitWithStrategies (Reaper/Driller) и
+обработчики событий DevastatorDrone на обертки с замером времени. Пока профилировщик
+не установлен, классы не тронуты и замеры ничего не стоят.
+
+    with TickProfiler() as profiler:
+        run_match(...)
+    print(profiler.report())
+"""
+import time
+from array import array
+from collections import defaultdict
+from functools import wraps
+
+from pestov import PestovDrone
+from stage_03_harvesters.utils.strategies import DroneUnitWithStrategies
+from stage_04_soldiers.devastator import DevastatorDrone
+
+DEVASTATOR_CALLBACKS = ('on_born', 'on_stop_at_asteroid', 'on_load_complete', 'on_stop_at_mothership',
+                        'on_unload_complete', 'on_stop_at_point', 'on_stop', 'on_wake_up')
+PROFILED_METHODS = [(PestovDrone, 'game_step'), (DroneUnitWithStrategies, 'game_step')] + [
+    (DevastatorDrone, name) for name in DEVASTATOR_CALLBACKS]
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, percent):
+    """Перцентиль по ближайшему рангу, values отсортированы"""
+    if not values:
+        return 0.0
+    rank = max(int(round(percent / 100.0 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+class TickProfiler:
+    """
+    Замер времени на дрона за тик.
+
+    Замеры пишутся в заранее выделенный кольцевой буфер: при переполнении
+    затираются самые старые, память не растет.
+    """
+
+    def __init__(self, capacity=1 << 16):
+        self.capacity = capacity
+        self._ticks = array('l', [0]) * capacity
+        self._drones = array('l', [0]) * capacity
+        self._teams = array('h', [0]) * capacity
+        self._seconds = array('d', [0.0]) * capacity
+        self._count = 0
+        self._team_names = []
+        self._team_index = {}
+        self._originals = []
+        self._depth = 0
+
+    def __enter__(self):
+        self.install()
+        return self
+
+    def __exit__(self, *exc):
+        self.uninstall()
+
+    @property
+    def installed(self):
+        return bool(self._originals)
+
+    def install(self):
+        """Подмена профилируемых методов обертками"""
+        if self.installed:
+            return
+        for cls, name in PROFILED_METHODS:
+            original = cls.__dict__[name]
+            self._originals.append((cls, name, original))
+            setattr(cls, name, self._wrap(original))
+
+    def uninstall(self):
+        """Возврат исходных методов"""
+        while self._originals:
+            cls, name, original = self._originals.pop()
+            setattr(cls, name, original)
+
+    def _wrap(self, method):
+        profiler = self
+        perf_counter = time.perf_counter
+
+        @wraps(method)
+        def timed(drone, *args, **kwargs):
+            # вложенные вызовы (super() в наследниках) учитываются во внешнем
+            if profiler._depth:
+                return method(drone, *args, **kwargs)
+            profiler._depth += 1
+            started = perf_counter()
+            try:
+                return method(drone, *args, **kwargs)
+            finally:
+                profiler.record(drone.scene._step, drone.team, drone.id, perf_counter() - started)
+                profiler._depth -= 1
+
+        return timed
+
+    def record(self, tick, team, drone_id, seconds):
+        index = self._team_index.get(team)
+        if index is None:
+            index = self._team_index[team] = len(self._team_names)
+            self._team_names.append(team)
+        slot = self._count % self.capacity
+        self._ticks[slot] = tick
+        self._drones[slot] = drone_id
+        self._teams[slot] = index
+        self._seconds[slot] = seconds
+        self._count += 1
+
+    def reset(self):
+        self._count = 0
+
+    def samples(self):
+        """Замеры из буфера: (тик, команда, id дрона, секунды)"""
+        size = min(self._count, self.capacity)
+        start = self._count - size
+        for n in range(start, self._count):
+            slot = n % self.capacity
+            yield self._ticks[slot], self._team_names[self._teams[slot]], self._drones[slot], self._seconds[slot]
+
+    def per_drone_tick(self):
+        """Суммарное время каждого дрона за тик, по командам"""
+        totals = defaultdict(float)
+        for tick, team, drone_id, seconds in self.samples():
+            totals[team, tick, drone_id] += seconds
+        by_team = defaultdict(list)
+        for (team, _, _), seconds in totals.items():
+            by_team[team].append(seconds)
+        return by_team
+
+    def per_team_tick(self):
+        """Суммарное время команды за тик"""
+        totals = defaultdict(float)
+        for tick, team, _, seconds in self.samples():
+            totals[tick, team] += seconds
+        return totals
+
+    def stats(self):
+        """Перцентили времени дрона за тик, по командам, в секундах"""
+        result = {}
+        for team, values in self.per_drone_tick().items():
+            values.sort()
+            result[team] = dict(count=len(values), max=values[-1], mean=sum(values) / len(values),
+                                **{'p{}'.format(p): percentile(values, p) for p in PERCENTILES})
+        return result
+
+    def worst_ticks(self, count=5):
+        """Самые дорогие тики: (тик, команда, секунды)"""
+        totals = self.per_team_tick()
+        worst = sorted(totals.items(), key=lambda item: -item[1])[:count]
+        return [(tick, team, seconds) for (tick, team), seconds in worst]
+
+    def report(self, worst=5):
+        lines = ['{:<20}{:>8}{:>10}{:>10}{:>10}{:>10}'.format('team, ms/drone/tick', 'samples', 'p50', 'p95',
+                                                               'p99', 'max')]
+        stats = self.stats()
+        for team in sorted(stats, key=lambda team: -stats[team]['p95']):
+            team_stats = stats[team]
+            lines.append('{:<20}{:>8}{:>10.3f}{:>10.3f}{:>10.3f}{:>10.3f}'.format(
+                team, team_stats['count'], team_stats['p50'] * 1000, team_stats['p95'] * 1000,
+                team_stats['p99'] * 1000, team_stats['max'] * 1000))
+        if worst:
+            lines.append('worst ticks:')
+            for tick, team, seconds in self.worst_ticks(worst):
+                lines.append('  tick {:>6} {:<20}{:>10.3f} ms'.format(tick, team, seconds * 1000))
+        if self._count > self.capacity:
+            lines.append('(only the last {} of {} samples kept)'.format(self.capacity, self._count))
+        return '\n'.join(lines)
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+RESERVATION_TTL = 1500  # тиков: за это время харвестер успевает долететь через все поле и загрузиться
+
+
+class Reservation:
+    """Бронь астероида"""
+
+    def __init__(self, owner, payload, expires):
+        self.owner = owner
+        self.payload = payload  # сколько элериума владелец собирается забрать
+        self.expires = expires  # тик, после которого бронь не действует
+
+
+class Reservations:
+    """
+    Таблица брони астероидов: астероид -> владелец, объем и срок брони.
+
+    У каждой брони есть владелец, поэтому брони погибшего или отступившего дрона
+    снимаются разом (release_owner), а забытые брони истекают сами через ttl тиков.
+    """
+
+    def __init__(self, ttl=RESERVATION_TTL):
+        self.ttl = ttl
+        self._by_asteroid = {}
+        self._by_owner = {}
+
+    def __len__(self):
+        return len(self._by_asteroid)
+
+    def __iter__(self):
+        return iter(list(self._by_asteroid.items()))
+
+    def claim(self, asteroid, owner, tick, payload=0):
+        """Забронировать астероид за owner (или продлить его бронь)"""
+        self.release(asteroid)
+        self._by_asteroid[asteroid] = Reservation(owner, payload, tick + self.ttl)
+        self._by_owner.setdefault(owner, set()).add(asteroid)
+
+    def release(self, asteroid, owner=None):
+        """Снять бронь с астероида; если задан owner - только его бронь"""
+        reservation = self._by_asteroid.get(asteroid)
+        if reservation is None or owner is not None and reservation.owner is not owner:
+            return
+        del self._by_asteroid[asteroid]
+        owned = self._by_owner.get(reservation.owner)
+        if owned is not None:
+            owned.discard(asteroid)
+            if not owned:
+                del self._by_owner[reservation.owner]
+
+    def release_owner(self, owner):
+        """Снять все брони owner"""
+        for asteroid in list(self._by_owner.get(owner, ())):
+            self.release(asteroid)
+
+    def get(self, asteroid, tick):
+        """Действующая бронь астероида или None"""
+        reservation = self._by_asteroid.get(asteroid)
+        if reservation is not None and reservation.expires < tick:
+            self.release(asteroid)
+            return None
+        return reservation
+
+    def is_reserved(self, asteroid, tick):
+        return self.get(asteroid, tick) is not None
+
+    def owner_of(self, asteroid, tick):
+        reservation = self.get(asteroid, tick)
+        return reservation.owner if reservation is not None else None
+
+    def owned_by(self, owner):
+        return set(self._by_owner.get(owner, ()))
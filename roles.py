@@ -1,12 +1,14 @@
 from robogame_engine.geometry import Point
 from astrobox.core import Asteroid
 
+from assignment import min_cost_assignment
+from routes import plan_route
+from spatial import asteroid_tree, current_tick, unit_grid
+from world import distances_from, world_view
+
 SUFFICIENT_PAYLOAD = 90
 SHOT_DISTANCE = 650
-
-
-class CantInterceptException(Exception):
-    pass
+ROUTE_CANDIDATES = 10  # из скольких ближайших источников планируется маршрут
 
 
 class Role:
@@ -32,9 +34,8 @@ class Fighter(Role):
 
     def check_for_enemy_drones(self):
         """проверка на вражеских дронов в радиусе поражения"""
-        for drone in self.unit.scene.drones:
-            if drone not in self.unit.__class__.my_team and self.unit.distance_to(
-                    drone) <= SHOT_DISTANCE and drone.is_alive:
+        for drone in unit_grid(self.unit.scene).in_radius(self.unit, SHOT_DISTANCE):
+            if drone not in self.unit.roster and drone.is_alive:
                 return drone
 
     def check_target_base(self):
@@ -43,7 +44,7 @@ class Fighter(Role):
             if self.unit.attack_plan.target_mothership.is_alive:
                 return self.unit.distance_to(self.unit.attack_plan.target_mothership) <= SHOT_DISTANCE
             else:
-                self.unit.attack_plan.abort_attack(self.unit.__class__.fighters)
+                self.unit.attack_plan.abort_attack(self.unit.roster.fighters)
                 return False
         else:
             return False
@@ -64,134 +65,160 @@ class Harvester(Role):
 
     def on_load_complete(self):
         """Действие при завершении загрузки элериума"""
-        if isinstance(self.unit.target, Asteroid) and self.unit.target in self.unit.__class__.unavailable_asteroids:
-            if self.unit.target.payload != 0:
-                self.unit.__class__.unavailable_asteroids.remove(self.unit.target)
+        self.unit.reservations.release(self.unit.target, owner=self.unit)
+        if self.unit.route and self.unit.route[0] is self.unit.target:
+            self.unit.route.pop(0)
         if self.unit.payload >= SUFFICIENT_PAYLOAD:
             self.unit.move_to_mothership()
-        elif self.unit.next_target:
-            self.unit.target = self.unit.next_target
-            max_payload = SUFFICIENT_PAYLOAD - self.unit.payload
-            self.make_route(max_payload)
+        elif self.follow_route():
             self.unit.move_at(self.unit.target)
         else:
-            try:
-                self.intercept_asteroid()
-            except CantInterceptException:
-                self.move_to_the_closest_asteroid()
-
-    def make_route(self, max_payload):
-        """прокладка оптимального маршрута по астероидам"""
-        if self.unit.target.payload < max_payload:
-            self.unit.next_target = self.get_next_asteroid()
-            if self.unit.next_target:
-                self.unit.__class__.unavailable_asteroids.append(self.unit.next_target)
+            self.assign_sources()
+
+    def make_route(self, first=None):
+        """
+        Прокладка маршрута по нескольким источникам, чтобы добрать SUFFICIENT_PAYLOAD.
+        Если задан first, маршрут начинается с него. Астероиды маршрута бронируются за дроном.
+        """
+        need = SUFFICIENT_PAYLOAD - self.unit.payload
+        candidates = [source for source in self.get_route_candidates() if source is not first]
+        if first is None:
+            self.unit.route = plan_route(self.unit, self.unit.my_mothership, candidates, need)
         else:
-            self.unit.next_target = None
+            self.unit.route = [first] + plan_route(first, self.unit.my_mothership, candidates, need - first.payload)
+        for source in self.unit.route:
+            # остановки сверх нужного тоже бронируются, чтобы маршрут не распался, но с нулевым объемом
+            self.reserve(source, max(need, 0))
+            need -= source.payload
+
+    def follow_route(self):
+        """
+        Взять следующую цель из маршрута.
+        Маршрут перестает действовать, если источник на нем опустел или его забрали.
+        """
+        if not self.unit.route or not all(self.is_on_route(source) for source in self.unit.route):
+            return False
+        self.unit.target = self.unit.route[0]
+        self.unit.next_target = self.unit.route[1] if len(self.unit.route) > 1 else None
+        return True
+
+    def is_on_route(self, source):
+        if source.payload <= 0:
+            return False
+        if isinstance(source, Asteroid):
+            return self.unit.reservations.owner_of(source, current_tick(self.unit.scene)) is self.unit
+        return True
 
     def try_to_depart(self):
         """Отправление с базы"""
-        self.move_to_the_closest_asteroid()
+        self.assign_sources()
         if self.unit.target == self.unit.my_mothership:
             self.unit.waiting = True
 
-    def move_to_the_closest_asteroid(self):
-        """Двигаться к ближайшему астероиду"""
-        self.unit.target = self.get_the_closest_asteroid()
-        if self.unit.target:
-            self.unit.__class__.unavailable_asteroids.append(self.unit.target)
-            self.make_route(SUFFICIENT_PAYLOAD)
+    def move_to_source(self, source):
+        """Двигаться по маршруту, начинающемуся с source, а если источника нет - на базу"""
+        self.unit.previous_target = Point(self.unit.x, self.unit.y)
+        if source is not None:
+            self.make_route(first=source)
+        if source is not None and self.follow_route():
             self.unit.move_at(self.unit.target)
         else:
+            self.unit.route = []
             self.unit.target = self.unit.my_mothership
             if self.unit.near(self.unit.my_mothership):
                 self.unit.waiting = True
             else:
                 self.unit.move_at(self.unit.target)
 
-    def intercept_asteroid(self):
-        """
-        Попытка перехватить цель у другого дрона,
-        если этот дрон находится ближе к цели.
-        """
-        distances = {}
-        for asteroid in self.unit.__class__.unavailable_asteroids:
-            distance = self.unit.distance_to(asteroid)
-            for drone in self.unit.teammates:
-                if drone.target == asteroid and drone.distance_to(asteroid) > distance:
-                    distances[asteroid] = [drone, distance]
-        for asteroid, drone_distance_pair in distances.items():
-            closest_drone = min(distances.values(), key=lambda x: x[1])
-            if drone_distance_pair == closest_drone:
-                self.unit.previous_target = Point(self.unit.x, self.unit.y)
-                self.unit.__class__.unavailable_asteroids.remove(asteroid)
-                self.move_to_the_closest_asteroid()
-                coords = Point(drone_distance_pair[0].x, drone_distance_pair[0].y)
-                drone_distance_pair[0].previous_target = coords
-                drone_distance_pair[0].role.move_to_the_closest_asteroid()
-                break
-        else:
-            raise CantInterceptException
+    def is_reassignable(self, drone):
+        """Харвестер команды еще летит к первому источнику маршрута, и его можно перенаправить"""
+        return (drone is not self.unit and drone.is_alive and isinstance(drone.role, Harvester) and
+                bool(drone.route) and drone.target is drone.route[0] and not drone.near(drone.target))
 
-    def get_the_closest_asteroid(self):
-        """
-        Выбор ближайшего к дрону астероида.
-        В первую очередь выбираются богатые элериумом астероиды.
+    def assign_sources(self):
         """
+        Назначение первых источников маршрута этому дрону и всем харвестерам команды,
+        которые еще не долетели до своего первого источника.
 
-        distances = self.get_distances()
-
-        for drone in self.unit.scene.drones:
-            if self.unit.target and drone.target:
-                distance_to_target = self.unit.target.distance_to(drone.target)
-                self.remove_asteroid_occupied_by_enemy(drone, distance_to_target, distances)
-
-        distances_to_rich = [
-            asteroid_distance_pair for asteroid_distance_pair in distances
-            if asteroid_distance_pair[0].payload >= SUFFICIENT_PAYLOAD]
-
-        if distances_to_rich:
-            return (min(distances_to_rich, key=lambda x: x[1]))[0]
-        elif distances:
-            return (min(distances, key=lambda x: x[1]))[0]
-
-    def get_next_asteroid(self):
-        """Выбрать ближайший к текущей цели астероид"""
-        distances = self.get_distances()
-
-        for drone in self.unit.scene.drones:
-            if self.unit.target and drone.target:
-                distance_to_target = self.unit.distance_to(self.unit.target) + self.unit.target.distance_to(
-                    drone.target)
-                self.remove_asteroid_occupied_by_enemy(drone, distance_to_target, distances)
-
-        if distances:
-            return (min(distances, key=lambda x: x[1]))[0]
+        Назначение решается для всех разом (см. assignment.py) по стоимости
+        "путь дрон -> источник -> база на единицу груза", так что дрон забирает
+        цель у напарника, только если от этого выигрывает вся команда.
+        """
+        drones = [self.unit] + [drone for drone in self.unit.roster.harvesters if self.is_reassignable(drone)]
+        sources = self.get_route_candidates()
+        for drone in drones[1:]:
+            if drone.target not in sources:
+                sources.append(drone.target)
+        to_base = distances_from(self.unit.my_mothership, sources)
+        costs = []
+        for drone in drones:
+            need = SUFFICIENT_PAYLOAD - drone.payload
+            costs.append([(to_source + back) / max(min(source.payload, need), 1)
+                          for to_source, back, source in zip(distances_from(drone, sources), to_base, sources)])
+
+        moves = []
+        for drone, column in zip(drones, min_cost_assignment(costs)):
+            source = sources[column] if column is not None else None
+            if drone is self.unit or source is not drone.target:
+                self.unit.reservations.release_owner(drone)
+                moves.append((drone, source))
+        roles = [(self if drone is self.unit else drone.role, source) for drone, source in moves]
+        # сначала бронируем все назначенные источники, чтобы маршруты дронов их не перехватили
+        for role, source in roles:
+            role.reserve(source, SUFFICIENT_PAYLOAD - role.unit.payload)
+        for role, source in roles:
+            role.move_to_source(source)
+
+    def reserve(self, source, payload):
+        """Забронировать астероид за дроном, на сбитых дронов и базы брони нет"""
+        if isinstance(source, Asteroid):
+            self.unit.reservations.claim(source, self.unit, current_tick(self.unit.scene),
+                                         payload=min(source.payload, payload))
+
+    def is_available(self, asteroid):
+        """На астероиде есть элериум и его никто из команды не забронировал"""
+        return asteroid.payload > 0 and not self.unit.reservations.is_reserved(asteroid, current_tick(self.unit.scene))
+
+    def has_available_asteroid(self):
+        return bool(asteroid_tree(self.unit.scene).nearest(self.unit, predicate=self.is_available))
+
+    def get_route_candidates(self):
+        """ROUTE_CANDIDATES ближайших к дрону свободных источников, на которые не летят враги"""
+        occupied = self.get_occupied_by_enemies(self.unit.distance_to)
+        asteroids = asteroid_tree(self.unit.scene).nearest(
+            self.unit, k=ROUTE_CANDIDATES,
+            predicate=lambda asteroid: self.is_available(asteroid) and asteroid not in occupied)
+        distances = [(asteroid, self.unit.distance_to(asteroid)) for asteroid in asteroids]
+        distances += [pair for pair in self.get_distances_to_wrecks() if pair[0] not in occupied]
+        distances.sort(key=lambda x: x[1])
+        return [source for source, _ in distances[:ROUTE_CANDIDATES]]
 
     def get_distances(self):
         """получение дистанций до возможных источников элериума"""
-        distances_to_asteroids = [(asteroid, self.unit.distance_to(asteroid)) for asteroid in self.unit.asteroids
-                                  if asteroid not in self.unit.__class__.unavailable_asteroids]
+        asteroids = [asteroid for asteroid in world_view(self.unit.scene).asteroids if self.is_available(asteroid)]
+        distances_to_asteroids = list(zip(asteroids, distances_from(self.unit, asteroids)))
 
-        distances_to_dead_enemies = [(drone, self.unit.distance_to(drone)) for drone in self.unit.scene.drones
-                                     if
-                                     drone not in self.unit.__class__.my_team and not drone.is_alive and not drone.is_empty]
+        return distances_to_asteroids + self.get_distances_to_wrecks()
 
-        distances_to_motherships = [(base, self.unit.distance_to(base)) for base in self.unit.scene.motherships
-                                    if base != self.unit.my_mothership and not base.is_alive and not base.is_empty]
+    def get_distances_to_wrecks(self):
+        """дистанции до сбитых вражеских дронов и баз, на которых остался элериум"""
+        view = world_view(self.unit.scene)
+        wrecks = [drone for drone in view.dead_drones_with_elerium if drone not in self.unit.roster]
+        wrecks += [base for base in view.dead_motherships_with_elerium if base != self.unit.my_mothership]
 
-        return distances_to_asteroids + distances_to_dead_enemies + distances_to_motherships
+        return list(zip(wrecks, distances_from(self.unit, wrecks)))
 
-    def remove_asteroid_occupied_by_enemy(self, drone, distance_to_target, distances):
+    def get_occupied_by_enemies(self, distance_to_target):
         """
-        исключение астероида из потенциальных целей,
-        если на него нацелен вражеский астероид
+        цели вражеских дронов, до которых им ближе, чем нам:
+        distance_to_target(target) - наш путь до цели
         """
-        if drone not in self.unit.__class__.my_team and drone.distance_to(drone.target) < distance_to_target:
-            for asteroid_distance_pair in distances:
-                if asteroid_distance_pair[0] == drone.target:
-                    distances.remove(asteroid_distance_pair)
-                    break
+        occupied = set()
+        for drone in self.unit.scene.drones:
+            if drone.target and drone not in self.unit.roster and \
+                    drone.distance_to(drone.target) < distance_to_target(drone.target):
+                occupied.add(drone.target)
+        return occupied
 
 
 class Guardian(Fighter):
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+from spatial import per_tick
+from world import world_view
+
+FIGHTER = 'fighter'
+HARVESTER = 'harvester'
+GUARDIAN = 'guardian'
+
+
+class Roster:
+    """
+    Состав команды: кто в ней, в какой роли, сколько потеряно и сколько осталось врагов.
+
+    Принадлежность к команде и к роли проверяется по множествам. Списки ролей
+    упорядочены, по месту дрона в списке AttackPlan раздает позиции.
+
+    По событию считаются только свои потери: в момент гибели дрона (см. PestovDrone.damage_taken).
+    Живые враги счетчиком не ведутся - о гибели чужих дронов движок не сообщает. Их число
+    пересчитывается проходом по снимку world.WorldView, O(n) по дронам сцены, один раз за тик
+    на команду, и кэшируется до следующего тика.
+    """
+
+    def __init__(self):
+        self.members = []
+        self._members = set()
+        self._dead = set()
+        self.roles = {FIGHTER: [], HARVESTER: [], GUARDIAN: []}
+        self._role_of = {}
+
+    def __contains__(self, drone):
+        return drone in self._members
+
+    def __len__(self):
+        return len(self.members)
+
+    @property
+    def fighters(self):
+        return self.roles[FIGHTER]
+
+    @property
+    def harvesters(self):
+        return self.roles[HARVESTER]
+
+    @property
+    def guardians(self):
+        return self.roles[GUARDIAN]
+
+    def add(self, drone):
+        """Регистрация дрона в команде"""
+        if drone not in self._members:
+            self._members.add(drone)
+            self.members.append(drone)
+
+    def set_role(self, drone, role):
+        """Перевод дрона в роль role"""
+        if drone in self._dead or self._role_of.get(drone) == role:
+            return
+        self.drop_role(drone)
+        self.roles[role].append(drone)
+        self._role_of[drone] = role
+
+    def drop_role(self, drone):
+        role = self._role_of.pop(drone, None)
+        if role is not None:
+            self.roles[role].remove(drone)
+
+    def role_of(self, drone):
+        return self._role_of.get(drone)
+
+    def on_death(self, drone):
+        """Учет гибели дрона команды, повторные вызовы ничего не меняют"""
+        if drone in self._members and drone not in self._dead:
+            self._dead.add(drone)
+            self.drop_role(drone)
+
+    @property
+    def dead(self):
+        return len(self._dead)
+
+    @property
+    def alive(self):
+        return len(self.members) - len(self._dead)
+
+    def _count_enemies(self, scene, team):
+        view = world_view(scene)
+        motherships = sum(1 for mothership in view.motherships if mothership.team != team and mothership.is_alive)
+        return len(view.enemies(team)), motherships
+
+    def _enemies(self, drone):
+        return per_tick(drone.scene, ('roster', id(self)), lambda scene: self._count_enemies(scene, drone.team))
+
+    def count_enemies(self, drone):
+        """Живые вражеские дроны"""
+        return self._enemies(drone)[0]
+
+    def enemies_alive(self, drone):
+        """Остались ли живые вражеские дроны или базы"""
+        drones, motherships = self._enemies(drone)
+        return drones > 0 or motherships > 0
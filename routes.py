@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Маршрут сбора элериума из нескольких остановок.
+
+Это маленькая задача ориентирования: из кандидатов выбрать и упорядочить
+остановки так, чтобы набрать need элериума и пролететь по пути
+start -> остановки -> finish как можно меньше в пересчете на единицу груза.
+До EXACT_LIMIT кандидатов она решается точно динамикой по подмножествам,
+дальше - жадной вставкой с доводкой порядка 2-opt.
+"""
+from world import coords, pairwise
+
+EXACT_LIMIT = 7  # 2**7 подмножеств на 7 последних остановок - считается за миллисекунды
+
+
+def route_length(dist, route, start, finish):
+    """Длина пути start -> route -> finish по матрице расстояний dist"""
+    length, previous = 0.0, start
+    for stop in route:
+        length += dist[previous][stop]
+        previous = stop
+    return length + dist[previous][finish]
+
+
+def _score(length, loaded, need):
+    """Сколько пролетаем на единицу груза, который поместится в трюм"""
+    return length / min(loaded, need)
+
+
+def _plan_exact(dist, payloads, need):
+    n = len(payloads)
+    start, finish = n, n + 1
+    full = 1 << n
+    inf = float('inf')
+    loaded = [0] * full
+    for mask in range(1, full):
+        low = mask & -mask
+        loaded[mask] = loaded[mask ^ low] + payloads[low.bit_length() - 1]
+    length = [[inf] * n for _ in range(full)]
+    parent = [[-1] * n for _ in range(full)]
+    for i in range(n):
+        length[1 << i][i] = dist[start][i]
+
+    best, best_state = None, None
+    # подмножество всегда больше своих частей, поэтому маски можно обходить по возрастанию
+    for mask in range(1, full):
+        for last in range(n):
+            current = length[mask][last]
+            if current == inf:
+                continue
+            key = (_score(current + dist[last][finish], loaded[mask], need), bin(mask).count('1'))
+            if best is None or key < best:
+                best, best_state = key, (mask, last)
+            if loaded[mask] >= need:
+                continue  # трюм полон, дальше лететь незачем
+            row = dist[last]
+            for following in range(n):
+                bit = 1 << following
+                if mask & bit:
+                    continue
+                candidate = current + row[following]
+                if candidate < length[mask | bit][following]:
+                    length[mask | bit][following] = candidate
+                    parent[mask | bit][following] = last
+
+    route = []
+    mask, last = best_state
+    while last != -1:
+        route.append(last)
+        mask, last = mask ^ (1 << last), parent[mask][last]
+    route.reverse()
+    return route
+
+
+def _two_opt(dist, route, start, finish):
+    """Разворачивать участки маршрута, пока это его укорачивает"""
+    improved = True
+    while improved:
+        improved = False
+        for i in range(len(route) - 1):
+            before = route[i - 1] if i else start
+            for j in range(i + 1, len(route)):
+                after = route[j + 1] if j + 1 < len(route) else finish
+                delta = (dist[before][route[j]] + dist[route[i]][after] -
+                         dist[before][route[i]] - dist[route[j]][after])
+                if delta < -1e-9:
+                    route[i:j + 1] = reversed(route[i:j + 1])
+                    improved = True
+    return route
+
+
+def _plan_greedy(dist, payloads, need):
+    n = len(payloads)
+    start, finish = n, n + 1
+    route, loaded, length = [], 0, dist[start][finish]
+    score = None
+    left = set(range(n))
+    while loaded < need and left:
+        best = None
+        for stop in left:
+            for position in range(len(route) + 1):
+                before = route[position - 1] if position else start
+                after = route[position] if position < len(route) else finish
+                added = dist[before][stop] + dist[stop][after] - dist[before][after]
+                key = _score(length + added, loaded + payloads[stop], need)
+                if best is None or key < best[0]:
+                    best = (key, stop, position, added)
+        key, stop, position, added = best
+        if score is not None and key >= score:
+            break
+        route.insert(position, stop)
+        left.discard(stop)
+        loaded += payloads[stop]
+        length += added
+        score = key
+    return _two_opt(dist, route, start, finish)
+
+
+def plan_route(start, finish, sources, need):
+    """
+    Остановки из sources в порядке облета.
+
+    :param start: откуда летим (дрон или точка)
+    :param finish: куда вернуться с грузом (база)
+    :param sources: кандидаты - объекты с payload > 0
+    :param need: сколько элериума нужно набрать
+    """
+    sources = [source for source in sources if source.payload > 0]
+    if not sources or need <= 0:
+        return []
+    xy = coords(sources + [start, finish])
+    dist = pairwise(xy, xy).tolist()
+    payloads = [source.payload for source in sources]
+    if len(sources) <= EXACT_LIMIT:
+        order = _plan_exact(dist, payloads, need)
+    else:
+        order = _plan_greedy(dist, payloads, need)
+    return [sources[i] for i in order]
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+Общее состояние команд, которое живет в атрибутах классов.
+
+Модуль не тянет за собой отрисовку (SpaceField), поэтому его можно импортировать
+и из прогона без UI, и из синтетической сцены.
+"""
+from robogame_engine.scene import Scene
+
+from pestov import PestovDrone
+from reservations import Reservations
+from roster import Roster
+from stage_03_harvesters.reaper import ReaperStrategy
+from stage_03_harvesters.vader import VaderDrone as HarvestersVaderDrone
+from stage_04_soldiers.devastator import DevastatorDrone, Headquarters
+from stage_04_soldiers.vader import VaderDrone as SoldiersVaderDrone
+from vader import VaderDrone
+
+
+def reset_shared_state():
+    """
+    Сброс общего состояния команд, которое живет в атрибутах классов.
+    Без этого второй матч в том же процессе видит дронов первого.
+    """
+    Scene._Scene__teams.clear()
+
+    PestovDrone.roster = Roster()
+    PestovDrone.reservations = Reservations()
+    PestovDrone.attack_plan = None
+
+    ReaperStrategy._data = {}
+    ReaperStrategy._distance_max = None
+    ReaperStrategy._distance_limit = None
+
+    DevastatorDrone.headquarters = None
+    Headquarters.roles = {}
+    Headquarters.asteroids_for_basa = []
+
+    VaderDrone.my_team = []
+    HarvestersVaderDrone.my_team = []
+    SoldiersVaderDrone.my_team = []
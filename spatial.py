@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""
+Пространственные индексы, общие для всех команд.
+
+Индексы строятся не чаще раза за тик (см. per_tick) и раздаются всем дронам
+сцены, поэтому стоимость построения не зависит от числа команд и дронов.
+"""
+import heapq
+import itertools
+import math
+import weakref
+from collections import defaultdict
+
+from robogame_engine.theme import theme
+
+GRID_CELL_SIZE = 128
+
+_tick_cache = weakref.WeakKeyDictionary()
+
+
+def current_tick(scene):
+    return scene._step
+
+
+def per_tick(scene, key, factory):
+    """Значение factory(scene), посчитанное один раз за тик сцены"""
+    cache = _tick_cache.get(scene)
+    if cache is None:
+        cache = _tick_cache[scene] = {}
+    tick = current_tick(scene)
+    entry = cache.get(key)
+    if entry is None or entry[0] != tick:
+        entry = cache[key] = (tick, factory(scene))
+    return entry[1]
+
+
+class UnitGrid:
+    """
+    Равномерная сетка по координатам юнитов.
+
+    Строится по положениям на начало тика, а отвечает по текущим: ячейки
+    просматриваются с запасом slack на то, сколько юнит успел пролететь с момента
+    построения, а расстояние проверяется точно. Результаты идут в том же порядке,
+    что и в исходном списке юнитов, как при полном переборе.
+    """
+
+    def __init__(self, units, cell_size=GRID_CELL_SIZE, slack=None):
+        self.cell_size = cell_size
+        self.slack = theme.DRONE_SPEED * 2 if slack is None else slack
+        self._cells = defaultdict(list)
+        self._size = 0
+        for order, unit in enumerate(units):
+            self._cells[self._cell(unit.x, unit.y)].append((order, unit))
+            self._size += 1
+        if self._cells:
+            self._min_cell = tuple(min(cell[i] for cell in self._cells) for i in (0, 1))
+            self._max_cell = tuple(max(cell[i] for cell in self._cells) for i in (0, 1))
+
+    def __len__(self):
+        return self._size
+
+    def _cell(self, x, y):
+        return int(x // self.cell_size), int(y // self.cell_size)
+
+    def _candidates(self, x, y, radius):
+        reach = radius + self.slack
+        left, bottom = self._cell(x - reach, y - reach)
+        right, top = self._cell(x + reach, y + reach)
+        left, bottom = max(left, self._min_cell[0]), max(bottom, self._min_cell[1])
+        right, top = min(right, self._max_cell[0]), min(top, self._max_cell[1])
+        cells = self._cells
+        for cx in range(left, right + 1):
+            for cy in range(bottom, top + 1):
+                cell = cells.get((cx, cy))
+                if cell:
+                    yield from cell
+
+    def in_radius(self, point, radius, predicate=None):
+        """Юниты не дальше radius от point (юнита или точки)"""
+        if not self._cells:
+            return []
+        x, y = point.x, point.y
+        found = []
+        for order, unit in self._candidates(x, y, radius):
+            if math.sqrt((unit.x - x) ** 2 + (unit.y - y) ** 2) <= radius and (predicate is None or predicate(unit)):
+                found.append((order, unit))
+        found.sort(key=lambda item: item[0])
+        return [unit for _, unit in found]
+
+    def nearest(self, point, k=1, predicate=None):
+        """k ближайших к point юнитов, при равенстве расстояний - в исходном порядке"""
+        if not self._cells:
+            return []
+        x, y = point.x, point.y
+        # дальше самого далекого угла сетки искать уже нечего
+        size = self.cell_size
+        left, bottom = self._min_cell[0] * size, self._min_cell[1] * size
+        right, top = (self._max_cell[0] + 1) * size, (self._max_cell[1] + 1) * size
+        limit = math.sqrt(max((x - left) ** 2, (x - right) ** 2) + max((y - bottom) ** 2, (y - top) ** 2))
+        radius = size
+        while True:
+            found = [(math.sqrt((unit.x - x) ** 2 + (unit.y - y) ** 2), order, unit)
+                     for order, unit in self._candidates(x, y, radius)
+                     if predicate is None or predicate(unit)]
+            found = [item for item in found if item[0] <= radius]
+            if len(found) >= k or radius > limit:
+                found.sort(key=lambda item: item[:2])
+                return [unit for _, _, unit in found[:k]]
+            radius *= 2
+
+
+def unit_grid(scene):
+    """Сетка по всем дронам сцены, общая для всех команд в пределах тика"""
+    return per_tick(scene, 'unit_grid', lambda s: UnitGrid(s.drones))
+
+
+class AsteroidTree:
+    """
+    KD-дерево по координатам астероидов.
+
+    Астероиды не двигаются, поэтому дерево строится один раз за матч. Опустевшие
+    астероиды выбывают из поиска лениво - когда поиск на них наткнется, - и
+    возвращаются в него на refresh, если на астероид снова что-то выгрузили.
+    В каждом узле хранится число непустых астероидов, пустые поддеревья не
+    просматриваются.
+    """
+
+    def __init__(self, asteroids, leaf_size=8):
+        self.asteroids = list(asteroids)
+        self._removed = set()
+        self._order = []
+        self._box = []
+        self._start = []
+        self._end = []
+        self._left = []
+        self._right = []
+        self._parent = []
+        self._alive = []
+        self._leaf_of = [0] * len(self.asteroids)
+        if self.asteroids:
+            self._build(list(range(len(self.asteroids))), leaf_size)
+
+    def __len__(self):
+        return len(self.asteroids)
+
+    def _add_node(self, indexes, parent):
+        xs = [self.asteroids[i].x for i in indexes]
+        ys = [self.asteroids[i].y for i in indexes]
+        self._box.append((min(xs), min(ys), max(xs), max(ys)))
+        self._start.append(len(self._order))
+        self._end.append(len(self._order))
+        self._left.append(-1)
+        self._right.append(-1)
+        self._parent.append(parent)
+        self._alive.append(len(indexes))
+        return len(self._box) - 1
+
+    def _build(self, indexes, leaf_size):
+        stack = [(indexes, -1, None)]
+        while stack:
+            indexes, parent, side = stack.pop()
+            node = self._add_node(indexes, parent)
+            if side is not None:
+                side[parent] = node
+            if len(indexes) <= leaf_size:
+                self._start[node] = len(self._order)
+                self._order.extend(indexes)
+                self._end[node] = len(self._order)
+                for index in indexes:
+                    self._leaf_of[index] = node
+                continue
+            x0, y0, x1, y1 = self._box[node]
+            if x1 - x0 >= y1 - y0:
+                indexes.sort(key=lambda i: self.asteroids[i].x)
+            else:
+                indexes.sort(key=lambda i: self.asteroids[i].y)
+            middle = len(indexes) // 2
+            stack.append((indexes[middle:], node, self._right))
+            stack.append((indexes[:middle], node, self._left))
+
+    def _update_alive(self, index, delta):
+        node = self._leaf_of[index]
+        while node != -1:
+            self._alive[node] += delta
+            node = self._parent[node]
+
+    def _remove(self, index):
+        if index not in self._removed:
+            self._removed.add(index)
+            self._update_alive(index, -1)
+
+    def refresh(self):
+        """Вернуть в поиск астероиды, на которые снова выгрузили элериум"""
+        for index in [index for index in self._removed if self.asteroids[index].payload > 0]:
+            self._removed.discard(index)
+            self._update_alive(index, 1)
+
+    def iter_nearest(self, point, predicate=None, via=None, with_empty=False):
+        """
+        Пары (расстояние, астероид) по возрастанию расстояния от point.
+
+        :param predicate: дополнительный фильтр астероидов, например по занятости
+        :param via: если задан, расстояние считается как путь point -> астероид -> via
+        :param with_empty: не пропускать опустевшие астероиды
+        """
+        if not self.asteroids:
+            return
+        px, py = point.x, point.y
+        vx, vy = (via.x, via.y) if via is not None else (None, None)
+        asteroids, alive, removed = self.asteroids, self._alive, self._removed
+
+        def box_bound(node):
+            x0, y0, x1, y1 = self._box[node]
+            dx, dy = max(x0 - px, 0.0, px - x1), max(y0 - py, 0.0, py - y1)
+            bound = math.sqrt(dx * dx + dy * dy)
+            if via is not None:
+                dx, dy = max(x0 - vx, 0.0, vx - x1), max(y0 - vy, 0.0, vy - y1)
+                bound += math.sqrt(dx * dx + dy * dy)
+            return bound
+
+        def distance(asteroid):
+            result = math.sqrt((px - asteroid.x) ** 2 + (py - asteroid.y) ** 2)
+            if via is not None:
+                result += math.sqrt((asteroid.x - vx) ** 2 + (asteroid.y - vy) ** 2)
+            return result
+
+        # узлы кладутся с отрицательным вторым ключом, астероиды - со своим индексом:
+        # при равных расстояниях узлы раскрываются раньше, а астероиды идут в исходном порядке
+        heap = [(box_bound(0), -1)]
+        while heap:
+            key, tie = heapq.heappop(heap)
+            if tie >= 0:
+                asteroid = asteroids[tie]
+                if not with_empty and asteroid.payload <= 0:
+                    self._remove(tie)
+                    continue
+                if predicate is None or predicate(asteroid):
+                    yield key, asteroid
+                continue
+            node = -1 - tie
+            if not with_empty and not alive[node]:
+                continue
+            if self._left[node] == -1:
+                for index in self._order[self._start[node]:self._end[node]]:
+                    if with_empty or index not in removed:
+                        heapq.heappush(heap, (distance(asteroids[index]), index))
+            else:
+                for child in (self._left[node], self._right[node]):
+                    heapq.heappush(heap, (box_bound(child), -1 - child))
+
+    def nearest(self, point, k=1, predicate=None, via=None, with_empty=False):
+        """k ближайших к point астероидов, см. iter_nearest"""
+        return [asteroid for _, asteroid in
+                itertools.islice(self.iter_nearest(point, predicate=predicate, via=via, with_empty=with_empty), k)]
+
+
+_asteroid_trees = weakref.WeakKeyDictionary()
+
+
+def _refresh_asteroid_tree(scene):
+    tree = _asteroid_trees.get(scene)
+    asteroids = scene.asteroids
+    if tree is None or len(tree) != len(asteroids):
+        tree = _asteroid_trees[scene] = AsteroidTree(asteroids)
+    else:
+        tree.refresh()
+    return tree
+
+
+def asteroid_tree(scene):
+    """Дерево астероидов сцены: строится один раз за матч, обновляется раз за тик"""
+    return per_tick(scene, 'asteroid_tree', _refresh_asteroid_tree)
@@ -1,28 +1,43 @@
+import heapq
+from itertools import islice
+from operator import itemgetter
+
 from .reaper import ReaperStrategy, ReaperDrone
-from robogame_engine.theme import theme
+
+from spatial import asteroid_tree
+from world import world_view
+
+HARVEST_CANDIDATES = 8  # ближайших свободных источников в назначении на дрона
 
 
 class DrillerStrategy(ReaperStrategy):
-    def distribute_harvest_sources(self, units):
-        # Distribute enough amount of units to harvest a source
-        for u in units:
-            if u == self.unit.mothership:
-                continue
-            if u in self.data._targets.values():
-                continue
-            if sum([theme.DRONE_CARGO_PAYLOAD for t in self.data._targets if
-                    self.data._targets[t] == u]) < u.cargo.payload:
-                return u
-
-    def get_harvest_target(self):
-        self.unit.pathfind.update_units(func=lambda u: not u.cargo.is_empty)
-        units = self.unit.pathfind.points
-        if not units:
-            return None
-        units.sort(key=lambda u: u.distance_to(self.unit))
+    # Every drone takes its source from the team assignment
+    _nearest_slots = 0
 
-        u = self.distribute_harvest_sources(units)
-        return u
+    def source_capacity(self, source, bound):
+        # One drone per source
+        return 0 if bound else 1
+
+    def get_harvest_target(self, assign=False):
+        # Источники по возрастанию расстояния, без полного списка и сортировки:
+        # астероиды лениво из общего дерева, остальное - обломки, их мало
+        view = world_view(self.unit.scene)
+        wrecks = [m for m in view.dead_enemy_motherships(self.unit.team) if not m.cargo.is_empty]
+        wrecks += view.dead_drones_with_elerium
+        wrecks = sorted(((u.distance_to(self.unit), u) for u in wrecks), key=itemgetter(0))
+        asteroids = asteroid_tree(self.unit.scene).iter_nearest(self.unit)
+        units = (u for _, u in heapq.merge(asteroids, wrecks, key=itemgetter(0)))
+        free = (u for u in units if u != self.unit.mothership and u.cargo.payload > 0 and
+                not self.data.count_targeting(u))
+        # ближайшие свободные, источники остальных дронов команды добавит assign_sources
+        return self.assign_sources(islice(free, HARVEST_CANDIDATES), assign)
+
+    def target_inputs(self, kind):
+        if kind == 'unload':
+            return None
+        view = world_view(self.unit.scene)
+        wrecks = [m for m in view.dead_enemy_motherships(self.unit.team) if not m.cargo.is_empty]
+        return len(view.elerium_asteroids), len(view.dead_drones_with_elerium), len(wrecks), self.data.revision
 
     def get_unload_target(self):
         return self.unit.mothership
@@ -9,6 +9,13 @@ from stage_03_harvesters.driller import DrillerDrone
 from pestov import PestovDrone
 
 NUMBER_OF_DRONES = 5
+TEAMS = (PestovDrone, DrillerDrone)
+SCENE_SETTINGS = dict(
+    field=(1200, 600),
+    speed=5,
+    asteroids_count=20,
+    can_fight=False,
+)
 
 
 class Logger:
@@ -40,10 +47,7 @@ class Logger:
 
 
 if __name__ == '__main__':
-    scene = SpaceField(
-        speed=5,
-        asteroids_count=20,
-    )
+    scene = SpaceField(**SCENE_SETTINGS)
 
     logger = Logger()
     logger.log_init()
@@ -1,19 +1,24 @@
 # -*- coding: utf-8 -*-
 
 import math
-from operator import mul
 
-from robogame_engine.geometry import Point
+import numpy as np
 from robogame_engine.theme import theme
 
+from assignment import min_cost_assignment
+from spatial import current_tick
+from world import coords, distances_from, pairwise
+
 from .utils.dijkstra import Dijkstra
-from .utils.states import DroneStateIdle
+from .utils.states import DroneStateHarvest, DroneStateIdle, StateMachine, StateStats
 from .utils.strategies import Strategy, DroneUnitWithStrategies
 
 
 class ReaperStrategy(Strategy):
     _distance_max = None
     _distance_limit = None
+    # First drones of the team go to the nearest sources and stay out of the team assignment
+    _nearest_slots = 3
 
     # Data contains information for team. It useful when
     # have more than one drone with that strategy
@@ -21,6 +26,49 @@ class ReaperStrategy(Strategy):
         def __init__(self):
             self._targets = {}
             self._drones = []
+            # Reverse index of _targets: target -> ids of drones going to it,
+            # and the place of each drone in _drones
+            self._by_target = {}
+            self._slots = {}
+            self.revision = 0  # changes with every change of targets
+            self.fsm_stats = StateStats()
+            # Pathfinding graphs are shared by the team and rebuilt at most once per tick
+            self._graphs = {}
+            self._graphs_tick = {}
+
+        def add_drone(self, drone):
+            if drone.id not in self._slots:
+                self._slots[drone.id] = len(self._drones)
+                self._drones.append(drone)
+
+        def slot(self, drone):
+            return self._slots[drone.id]
+
+        def set_target(self, drone, target):
+            previous = self._targets.get(drone.id)
+            if previous is target and drone.id in self._targets:
+                return
+            if previous is not None:
+                going = self._by_target[previous]
+                going.discard(drone.id)
+                if not going:
+                    del self._by_target[previous]
+            self._targets[drone.id] = target
+            if target is not None:
+                self._by_target.setdefault(target, set()).add(drone.id)
+            self.revision += 1
+
+        def targeting(self, target):
+            """Drones going to target"""
+            return [self._drones[self._slots[i]] for i in self._by_target.get(target, ())]
+
+        def count_targeting(self, target):
+            return len(self._by_target.get(target, ()))
+
+        def graph(self, name, unit):
+            if name not in self._graphs:
+                self._graphs[name] = Dijkstra(unit)
+            return self._graphs[name]
 
     _data = {}
 
@@ -39,105 +87,163 @@ class ReaperStrategy(Strategy):
         if ReaperStrategy._distance_limit is None:
             ReaperStrategy._distance_limit = 0.25 * ReaperStrategy._distance_max
 
-        self.data._drones.append(self.unit)
+        self.data.add_drone(self.unit)
 
         # PathFinder
         if self.unit.pathfind is None:
-            self.unit.pathfind = Dijkstra(self.unit)
+            self.unit.pathfind = self.data.graph('harvest', self.unit)
         if self.unit.pathfind_unload is None:
-            self.unit.pathfind_unload = Dijkstra(self.unit)
+            self.unit.pathfind_unload = self.data.graph('unload', self.unit)
         self.data._enemy_drones = [d for d in self.unit.scene.drones if d.team != self.unit.team]
 
     def weight_harvest_func(self, a, b):
-        dist = a.distance_to(b)
-        distlim = self._distance_limit
         if b.cargo.fullness == 0.0 or b.__class__ == self.unit.mothership.__class__:
             return float("inf")
-        amdist = a.distance_to(self.unit.mothership)
-        bmdist = b.distance_to(self.unit.mothership)
-        abdist = a.distance_to(b)
-        k = float(self._distance_max)
-        coef = [1.0 / distlim, 1.0]
-        values = [dist, 1.0 - b.cargo.fullness]
-        return sum(map(mul, coef, values))
+        return (1.0 / self._distance_limit) * a.distance_to(b) + (1.0 - b.cargo.fullness)
+
+    def weight_harvest_kernel(self, sources, targets):
+        # weight_harvest_func for all pairs at once
+        fullness = np.array([b.cargo.fullness for b in targets])
+        weights = (1.0 / self._distance_limit) * pairwise(coords(sources), coords(targets)) + (1.0 - fullness)
+        closed = (fullness == 0.0) | np.array([b.__class__ == self.unit.mothership.__class__ for b in targets])
+        weights[:, closed] = float("inf")
+        return weights
+
+    def team_graph(self, name, node_filter, kernel):
+        graph = self.data.graph(name, self.unit).bind(self.unit)
+        tick = current_tick(self.unit.scene)
+        if self.data._graphs_tick.get(name) != tick:
+            self.data._graphs_tick[name] = tick
+            graph.update_units(func=node_filter, key=name)
+            graph.calc_weights(kernel=kernel)
+        self.unit._path_closest = graph.closest_to(self.unit)
+        return graph
+
+    def harvest_graph(self):
+        return self.team_graph('harvest', lambda u: not u.cargo.is_empty, self.weight_harvest_kernel)
+
+    def unload_graph(self):
+        return self.team_graph('unload', lambda u: u.cargo.fullness < 1.0, self.weight_unload_kernel)
+
+    def target_inputs(self, kind):
+        # What get_harvest_target ('harvest') or get_unload_target ('unload') depends on, besides the drone
+        graph = self.harvest_graph() if kind == 'harvest' else self.unload_graph()
+        return graph.version, self.data.revision
 
     def get_harvest_source(self):
-        center_of_scene = Point(theme.FIELD_WIDTH / 2, theme.FIELD_HEIGHT / 2)
         units = self.unit.pathfind.points
-        units.sort(key=lambda u: u.distance_to(self.unit.mothership))
+        distances = dict(zip(map(id, units), distances_from(self.unit.mothership, units)))
+        units = sorted(units, key=lambda u: distances[id(u)])
         units = [u for u in units if u != self.unit.mothership]
         return units[0] if units else None
 
-    def distribute_harvest_sources(self, units):
-        # Distribute enought amount of units to harvest a source
-        for u in units:
-            if u == self.unit.mothership:
-                continue
-            if sum([theme.DRONE_CARGO_PAYLOAD for t in self.data._targets if
-                    self.data._targets[t] == u]) < u.cargo.payload:
-                return u
-        return None
-
-    def get_harvest_target(self):
-        self.unit.pathfind.update_units(func=lambda u: not u.cargo.is_empty)
-
-        didx = self.data._drones.index(self.unit)
-        if didx < 3:
-            center_of_scene = self.unit.mothership.coord.copy()
+    def source_capacity(self, source, bound):
+        # How many more drones the source takes when bound drones of the team are already going to it
+        return max(int(math.ceil(source.cargo.payload / float(theme.DRONE_CARGO_PAYLOAD))) - bound, 0)
+
+    def reassignable_drones(self):
+        # Teammates still flying to their sources: the team assignment may give them other ones
+        return [drone for drone in self.data._drones if drone is not self.unit and drone.is_alive and
+                self.data.slot(drone) >= self._nearest_slots and
+                isinstance(drone.fsm_state, DroneStateHarvest) and drone.fsm_state.is_reassignable]
+
+    def assign_sources(self, sources, assign=False):
+        """
+        Source for this drone from a min-cost assignment of the drone and the reassignable teammates
+        to sources (their current ones included), each source taking source_capacity drones.
+        Cost is the way drone -> source -> mothership per unit of cargo.
+        With assign=True teammates whose source changed are sent to the new one.
+        """
+        drones = [self.unit] + self.reassignable_drones()
+        current = [self.data._targets.get(drone.id) for drone in drones[1:]]
+        unique = {}
+        for source in list(sources) + current:
+            if source is not None and source is not self.unit.mothership and source.cargo.payload > 0:
+                unique.setdefault(id(source), source)
+        columns = []
+        for source in unique.values():
+            bound = self.data.count_targeting(source) - sum(1 for target in current if target is source)
+            columns += [source] * self.source_capacity(source, bound)
+        if not columns:
+            return None
+
+        back = distances_from(self.unit.mothership, columns)
+        costs = []
+        for drone in drones:
+            room = max(drone.cargo.free_space, 1)
+            costs.append([(to_source + to_base) / max(min(source.cargo.payload, room), 1)
+                          for source, to_source, to_base in zip(columns, distances_from(drone, columns), back)])
+        assigned = min_cost_assignment(costs)
+        if assign:
+            for drone, target, column in zip(drones[1:], current, assigned[1:]):
+                if column is not None and columns[column] is not target:
+                    drone.fsm_state.retarget(columns[column])
+        return columns[assigned[0]] if assigned[0] is not None else None
+
+    def get_harvest_target(self, assign=False):
+        self.harvest_graph()
+
+        didx = self.data.slot(self.unit)
+        if didx < self._nearest_slots:
             units = [p for p in self.unit.pathfind.points if p != self.unit.mothership]
             if not units:
                 return None
-            units.sort(key=lambda u: u.distance_to(self.unit))
+            distances = dict(zip(map(id, units), distances_from(self.unit, units)))
+            units.sort(key=lambda u: distances[id(u)])
             return units[didx] if len(units) - 1 >= didx else units[0]
 
-        self.unit.pathfind.calc_weights(func=self.weight_harvest_func)
         fat_source = self.get_harvest_source()
         if not fat_source:
             return None
 
-        path = self.unit.pathfind.find_path(self.unit.mothership, fat_source, as_objects=True)
+        path = self.unit.pathfind.shortest_path(self.unit.mothership, fat_source, as_objects=True, direct=False)
         if path is None:
             return None
 
-        u = self.distribute_harvest_sources(path)
+        u = self.assign_sources(path, assign)
         if u:
             return u
 
-        pos = self.data._drones.index(self.unit)
         sz = len(path)
-        idx = min(sz, (pos % (sz - 1)) + 1 if sz > 1 else 0)
+        idx = min(sz, (didx % (sz - 1)) + 1 if sz > 1 else 0)
         return path[idx]
 
     def weight_unload_func(self, a, b):
         if a == self.unit.mothership or b == self.unit.mothership:
             return 0.0
-        dist = a.distance_to(b)
         adist = self.unit.mothership.distance_to(a)
         bdist = self.unit.mothership.distance_to(b)
-        coef = [bdist / adist, 1.0]
-        values = [dist, 1.0 - b.cargo.fullness]
-        return sum(map(mul, coef, values))
+        return (bdist / adist) * a.distance_to(b) + (1.0 - b.cargo.fullness)
+
+    def weight_unload_kernel(self, sources, targets):
+        # weight_unload_func for all pairs at once
+        mothership = self.unit.mothership
+        home = coords([mothership])
+        adist = pairwise(coords(sources), home)
+        bdist = pairwise(home, coords(targets))
+        fullness = np.array([b.cargo.fullness for b in targets])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            weights = (bdist / adist) * pairwise(coords(sources), coords(targets)) + (1.0 - fullness)
+        weights[[a is mothership for a in sources]] = 0.0
+        weights[:, [b is mothership for b in targets]] = 0.0
+        return weights
 
     def get_unload_target(self):
-        if self.data._drones.index(self.unit) < 2:
+        if self.data.slot(self.unit) < 2:
             return self.unit.mothership
         if len([a for a in self.unit.scene.asteroids if a.cargo.payload > 0]) == 0:
             return self.unit.mothership
 
-        self.unit.pathfind_unload.update_units(func=lambda u: u.cargo.fullness < 1.0)
-
+        self.unload_graph()
         uclosest = self.unit.closest_in_path
-        self.unit.pathfind_unload.calc_weights(func=self.weight_unload_func)
 
-        path_unload = self.unit.pathfind_unload.find_path(uclosest, self.unit.mothership,
-                                                          as_objects=True)  # , info="unld")
+        path_unload = self.unit.pathfind_unload.shortest_path(uclosest, self.unit.mothership,
+                                                              as_objects=True, direct=False)
         if path_unload is None:
             return None
 
-        pos = self.data._drones.index(self.unit)
-        sz = len(path_unload)
         # Возврат, проекция бинарного поиска в отношении path-finding
-        idx = min(len(path_unload) - 1, int(len(path_unload) / 2) + 1) if sz > 1 else 0
+        idx = min(len(path_unload) - 1, int(len(path_unload) / 2) + 1) if len(path_unload) > 1 else 0
         return path_unload[-idx]
 
     @property
@@ -152,13 +258,9 @@ class ReaperStrategy(Strategy):
         self._stepnum = self._stepnum + 1
         super(ReaperStrategy, self).game_step(*args, **kwargs)
 
-        newState = self.fsm_state.make_transition()
-        if newState != self.fsm_state.__class__:
-            self.data._targets[self.unit.id] = None
-            self.unit.set_fsm_state(newState(self))
-
-        if self.unit.fsm_state:
-            self.unit.fsm_state.game_step()
+        if self.unit.fsm.update():
+            self.data.set_target(self.unit, None)
+        self.unit.fsm.game_step()
 
 
 class ReaperDrone(DroneUnitWithStrategies):
@@ -169,7 +271,7 @@ class ReaperDrone(DroneUnitWithStrategies):
         super(ReaperDrone, self).__init__(*args, **kwargs)
         self.pathfind = None
         self.pathfind_unload = None
-        self.__fsm_state = None
+        self.fsm = None
         self._strategy = None
         self._path_closest = None
 
@@ -179,13 +281,10 @@ class ReaperDrone(DroneUnitWithStrategies):
 
     @property
     def fsm_state(self):
-        return self.__fsm_state
-
-    def set_fsm_state(self, new_fsm_state):
-        self.__fsm_state = new_fsm_state
+        return self.fsm.state if self.fsm is not None else None
 
     def on_born(self):
         super(ReaperDrone, self).on_born()
         self._strategy = self._strategy_class(unit=self)
-        self.set_fsm_state(DroneStateIdle(self._strategy))
+        self.fsm = StateMachine(self._strategy, DroneStateIdle, self._strategy.data.fsm_stats)
         self.append_strategy(self._strategy)
@@ -1,11 +1,73 @@
+import heapq
 import sys
 
+import numpy as np
+
+from world import distances_from, world_view
+
+FLOYD_LIMIT = 64  # up to that many nodes Floyd-Warshall costs about as much as two single-target searches
+
+
+def floyd_warshall(weights):
+    """All-pairs distances and next nodes: nxt[i][j] - node after i on the way to j, -1 if no way"""
+    size = len(weights)
+    dist = weights.copy()
+    nxt = np.where(np.isfinite(dist), np.arange(size)[None, :], -1)
+    for k in range(size):
+        via = dist[:, k, None] + dist[None, k, :]
+        better = via < dist
+        dist = np.where(better, via, dist)
+        nxt = np.where(better, nxt[:, k, None], nxt)
+    return dist, nxt
+
+
+class EuclideanHeuristic(object):
+    # Heuristics with the same scale are equal, so their paths share the cache of find_path
+    def __init__(self, scale=1.0):
+        self.scale = scale
+
+    def __call__(self, a, b):
+        return self.scale * a.distance_to(b)
+
+    def __eq__(self, other):
+        return isinstance(other, EuclideanHeuristic) and other.scale == self.scale
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((EuclideanHeuristic, self.scale))
+
 
 class Dijkstra:
-    def __init__(self, unit, points=None):
+    def __init__(self, unit, points=None, trace=False):
         self._unit = unit
-        self._points = points if points else []
-        self._weights = [[0.0 for _ in range(len(self._points))] for _ in range(len(self._points))]
+        # A node keeps its slot (index in paths and weights) while it stays in the graph.
+        # Slots of removed nodes are reused by new ones, until then their edges are inf.
+        self._nodes = []
+        self._slot = {}
+        self._free = []
+        self._active = None  # nodes and their slots in slot order, see points
+        self._weights = np.zeros((0, 0))
+        # what the weights of each node were computed for: cargo payload, None - not computed yet
+        self._cargo = []
+        self._levels = []  # (is_empty, is_full) of each node
+        # payload of each candidate when update_units last asked the filter about it
+        self._seen = {}
+        self._filter = None
+        self._weight_func = None
+        self.trace = trace
+        # Paths are reused until the graph version changes: a node appears or disappears,
+        # its cargo becomes or stops being empty or full, or the weight function changes
+        self.version = 0
+        self._paths = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # Shortest paths to each target for the current version, see shortest_path
+        self._towards = {}
+        self._all_pairs = None
+        for point in points or []:
+            self._add(point)
 
     @staticmethod
     def maxint():
@@ -13,142 +75,322 @@ class Dijkstra:
 
     @property
     def points(self):
-        return self._points
+        # Shared list, callers must not change it
+        return self._active_nodes()[0]
 
     @property
     def weights(self):
         return self._weights
 
+    def _bump_version(self):
+        self.version += 1
+        self._paths = {}
+        self._towards = {}
+        self._all_pairs = None
+
+    def bind(self, unit):
+        # A team graph is shared: queries run on behalf of the drone that asks
+        self._unit = unit
+        return self
+
     def _get_closest(self):
-        if not self._unit.is_alive:
+        return self.closest_to(self._unit)
+
+    def closest_to(self, unit):
+        if not unit.is_alive:
             return
-        uclosest = self._points[0]
-        dclosest = self._points[0].distance_to(self._unit)
-        for u in self._points:
-            chkdist = self._unit.distance_to(u)
+        points = self.points
+        uclosest = points[0]
+        dclosest = points[0].distance_to(unit)
+        for u, chkdist in zip(points, distances_from(unit, points)):
             if chkdist < dclosest:
                 dclosest = chkdist
                 uclosest = u
         return uclosest
 
-    def update_units(self, func=None):
+    def update_units(self, func=None, key=None):
+        """
+        Bring the node set up to date: the mothership, and asteroids, dead enemy motherships
+        and dead drones that pass func. func must depend on the unit's cargo only:
+        it is asked again only about units whose payload changed since the last call.
+        key identifies the filter between calls (team_graph passes the graph name),
+        without it the function object itself is compared.
+        """
         if func is None:
-            func = lambda a: True
-        units = [self._unit.mothership, ]
-        units = units + [a for a in self._unit.scene.asteroids if func(a)]
-        units = units + [m for m in self._unit.scene.motherships if
-                         not m.is_alive and m.team != self._unit.team and func(m)]
-        units = units + [d for d in self._unit.scene.drones if not d.is_alive and func(d)]
-        weights = [[0.0 for _ in range(len(units))] for _ in range(len(units))]
-
-        self._weights, self._points = weights, units
+            func = self._accept_all
+        if key is None:
+            key = func
+        if key != self._filter:
+            self._filter = key
+            self._seen = {}
+        view = world_view(self._unit.scene)
+        if id(self._unit.mothership) not in self._slot:
+            self._add(self._unit.mothership)
+        for units in (view.asteroids, view.dead_enemy_motherships(self._unit.team), view.dead_drones):
+            for u in units:
+                payload = u.cargo.payload
+                if self._seen.get(id(u)) == payload:
+                    continue
+                self._seen[id(u)] = payload
+                slot = self._slot.get(id(u))
+                if func(u):
+                    if slot is None:
+                        self._add(u)
+                elif slot is not None:
+                    self._remove(slot)
+
         self._unit._path_closest = self._get_closest()
 
+    @staticmethod
+    def _accept_all(unit):
+        return True
+
+    def _add(self, unit):
+        if self._free:
+            slot = heapq.heappop(self._free)
+        else:
+            slot = len(self._nodes)
+            self._nodes.append(None)
+            self._cargo.append(None)
+            self._levels.append(None)
+            if slot >= len(self._weights):
+                self._grow(max(8, 2 * len(self._weights)))
+        self._nodes[slot] = unit
+        self._slot[id(unit)] = slot
+        self._active = None
+        self._bump_version()
+
+    def _remove(self, slot):
+        del self._slot[id(self._nodes[slot])]
+        self._nodes[slot] = None
+        self._cargo[slot] = self._levels[slot] = None
+        self._weights[slot, :] = float("inf")
+        self._weights[:, slot] = float("inf")
+        self._weights[slot, slot] = 0.0
+        heapq.heappush(self._free, slot)
+        self._active = None
+        self._bump_version()
+
+    def _grow(self, capacity):
+        weights = np.full((capacity, capacity), float("inf"))
+        np.fill_diagonal(weights, 0.0)
+        size = len(self._weights)
+        weights[:size, :size] = self._weights
+        self._weights = weights
+
+    def _active_nodes(self):
+        if self._active is None:
+            slots = [k for k, u in enumerate(self._nodes) if u is not None]
+            self._active = ([self._nodes[k] for k in slots], slots)
+        return self._active
+
+    def _index(self, unit):
+        slot = self._slot.get(id(unit))
+        if slot is None:
+            raise ValueError("{} is not in the graph".format(unit))
+        return slot
+
     def to_objects(self, indexes):
-        return [self._points[n] for n in indexes]
+        return [self._nodes[n] for n in indexes]
 
     def weight_default_func(self, a, b):
         return float(a.distance_to(b))
 
-    def calc_weights(self, func=None):
+    def calc_weights(self, func=None, kernel=None):
+        """
+        Weights func(a, b) of all edges. Only rows and columns of nodes that are new
+        or whose cargo changed since the last call are recomputed.
+        kernel(sources, targets) - the same weights as an array for all pairs at once, used instead of func.
+        The same method of another drone of the team counts as the same func.
+        """
         if not self._unit.is_alive:
             return
-        if func is None:
+        if func is None and kernel is None:
             func = self.weight_default_func
-        dump = []
-        for f, a in enumerate(self._points):
-            def map_func(t, b):
-                if f == t:
-                    self._weights[f][t] = 0.0
-                else:
-                    d = float(func(a, b))
-                    self._weights[f][t] = d
-
-            map(map_func, *zip(*enumerate(self._points)))
-            dump.append("%s %s" % (
-                self._unit.id, ",".join(["%8.2f" % d if d < float("inf") else "%8s"
-                                         for d in self._weights[f]])))
-            dump.append("")
-
-    def find_path(self, pt_from, pt_to, as_objects=False, info=None):
+        weight_func = getattr(kernel or func, '__func__', kernel or func)
+        if weight_func != self._weight_func:
+            self._weight_func = weight_func
+            self._cargo = [None] * len(self._nodes)
+            self._bump_version()
+        points, slots = self._active_nodes()
+        dirty = []
+        for k, u in zip(slots, points):
+            payload = u.cargo.payload
+            if self._cargo[k] == payload:
+                continue
+            self._cargo[k] = payload
+            dirty.append(k)
+            level = (u.cargo.is_empty, u.cargo.is_full)
+            if self._levels[k] != level:
+                self._levels[k] = level
+                self._bump_version()
+        if dirty and kernel is not None:
+            changed = [self._nodes[k] for k in dirty]
+            self._weights[np.ix_(dirty, slots)] = kernel(changed, points)
+            self._weights[np.ix_(slots, dirty)] = kernel(points, changed)
+            self._weights[dirty, dirty] = 0.0
+        else:
+            for k in dirty:
+                u = self._nodes[k]
+                self._weights[k, slots] = [float(func(u, b)) for b in points]
+                self._weights[slots, k] = [float(func(a, u)) for a in points]
+                self._weights[k, k] = 0.0
+        if self.trace:
+            print("\n".join("%s %s" % (self._unit.id, ",".join(["%8.2f" % d if d < float("inf") else "%8s"
+                                                                  for d in self._weights[k, slots]]))
+                            for k in slots))
+
+    def find_path(self, pt_from, pt_to, as_objects=False, info=None, prune=True, heuristic=None):
+        """
+        Path from pt_from to pt_to over the current weights (heap-based Dijkstra).
+
+        prune: skip edges not shorter than the mean weight of the node's unvisited
+               neighbours, and never hop from pt_from straight to pt_to
+        heuristic: A* - func(a, b) that never overestimates the path cost, see euclidean_heuristic.
+                   Cached paths are keyed by it: pass equal heuristics to reuse them
+        If pt_to is unreachable, the path is [pt_from, pt_to].
+        """
         if not self._unit.is_alive:
             return
-        if pt_from not in self._points or pt_to not in self._points:
-            print(pt_from, pt_to, self._points)
-        fi = self._points.index(pt_from)
-        fo = self._points.index(pt_to)
+        fi = self._index(pt_from)
+        fo = self._index(pt_to)
         if info:
             info = [
                 "[{}:{}] {}->{} U:{} M:{}".format(
                     info, self._unit.id, fi, fo, self._unit, self._unit.mothership), ]
-        if fi == fo:
-            if as_objects:
-                return self.to_objects([fi, ])
+        key = (fi, fo, prune, heuristic)
+        if not info and key in self._paths:
+            self.cache_hits += 1
+            path = self._paths[key]
+        elif fi == fo:
+            path = [fi, ]
+        else:
+            self.cache_misses += 1
+            estimate = None
+            if heuristic is not None:
+                estimate = [heuristic(p, pt_to) if p is not None else 0.0 for p in self._nodes]
+            prev, cost = self._search(fi, fo, prune, estimate)
+            if info:
+                for k in self._active_nodes()[1]:
+                    info.append("        {}\t{}\t{}".format(
+                        k, [int(prev[k]), float(cost[k])], self._unit.mothership.distance_to(self._nodes[k])))
+            if cost[fo] == float("inf"):
+                path = [fi, fo]
             else:
-                return [fi, ]
-
-        visited = []
-        unvisited = [k for k, _ in enumerate(self._points)]
-
-        FPREV = 0
-        FCOST = 1
-        table = [[-1, float("inf")] for p in range(len(self._points))]
-        table[fi][FCOST] = 0.0
-        root = fi
-        lastroot = root
-        while len(unvisited):
-            visited.append(root)
-            unvisited.pop(unvisited.index(root))
-            if not unvisited:
-                break
-
-            neighbors = [uv for uv in unvisited if self._weights[root][uv] < float("inf")]
-            midw = sum([self._weights[root][nb] for nb in neighbors]) / max(float(len(neighbors)), 1.0)
-            for nb in neighbors:
-                if root == fi and nb == fo:
-                    continue
-                if self._weights[root][nb] >= midw:
-                    continue
-                cost = table[root][FCOST] + self._weights[root][nb]
-                if cost < table[nb][FCOST]:
-                    table[nb][FCOST] = cost
-                    table[nb][FPREV] = root
-
-            shortest = float("inf")
-            lastroot = root
-            for uv in unvisited:
-                if uv == lastroot:
-                    continue
-                # Found minimal cost vertex
-                if table[uv][FCOST] < shortest:
-                    shortest = table[uv][FCOST]
-                    root = uv
-            # FIXME
-            if root == lastroot:
-                if unvisited:
-                    root = unvisited[0]
-                else:
-                    break
-        if table[root][FCOST] == float("inf"):
-            table[root][FCOST] = table[lastroot][FCOST] + self._weights[lastroot][root]
-            table[root][FPREV] = lastroot
-        if info:
-            for k, t in enumerate(table):
-                info.append("        {}\t{}\t{}".format(
-                    k, t, self._unit.mothership.distance_to(self._points[k])))
-        path = []
-        root = fo  # back propagation
-        while table[root][FPREV] > -1:
-            path.insert(0, root)
-            root = table[root][FPREV]
-        path.insert(0, root)
+                path = [fo]
+                while prev[path[0]] > -1:
+                    path.insert(0, int(prev[path[0]]))
+            self._paths[key] = path
         if info:
             info.append("        -----")
             for _, t in enumerate(path):
                 info.append("        {}\t{}\t{}".format(
-                    t, self._points[t], self._unit.mothership.distance_to(self._points[t])))
+                    t, self._nodes[t], self._unit.mothership.distance_to(self._nodes[t])))
             print("\n".join(info))
         if as_objects:
             return self.to_objects(path)
+        else:
+            return list(path)
+
+    def shortest_path(self, pt_from, pt_to, as_objects=False, direct=True):
+        """
+        Shortest path without pruning, looked up in the all-pairs table of the current graph version.
+
+        direct: allow the path to be the single edge pt_from -> pt_to
+        If pt_to is unreachable, the path is [pt_from, pt_to].
+        """
+        if not self._unit.is_alive:
+            return
+        fi = self._index(pt_from)
+        fo = self._index(pt_to)
+        dist, nxt = self._paths_towards(fo)
+        if fi == fo:
+            path = [fi, ]
+        elif direct:
+            path = self._follow(fi, fo, nxt) if dist[fi] < float("inf") else [fi, fo]
+        else:
+            path = self._indirect(fi, fo, dist, nxt)
+            if fi in path[1:]:
+                # the best way from the first hop goes back through pt_from: look for one that avoids it
+                path = self._indirect(fi, fo, *self._paths_avoiding(fi, fo))
+        if as_objects:
+            return self.to_objects(path)
         else:
             return path
+
+    def _indirect(self, fi, fo, dist, nxt):
+        """Path fi -> via -> ... -> fo with via not fi or fo, over distances to fo; [fi, fo] if there is none"""
+        costs = self._weights[fi] + dist
+        costs[[fi, fo]] = float("inf")
+        via = int(np.argmin(costs))
+        return [fi] + self._follow(via, fo, nxt) if costs[via] < float("inf") else [fi, fo]
+
+    def _paths_avoiding(self, fi, fo):
+        """Like _paths_towards(fo), but over the graph without fi"""
+        key = (fo, fi)
+        if key not in self._towards:
+            weights = self._weights.copy()
+            weights[fi, :] = float("inf")
+            weights[:, fi] = float("inf")
+            nxt, dist = self._search(fo, None, False, weights=weights.T)
+            nxt[fo] = fo
+            self._towards[key] = dist, nxt
+        return self._towards[key]
+
+    def _paths_towards(self, fo):
+        """Distances from every node to fo and the next node on the way there"""
+        if fo not in self._towards:
+            if len(self._weights) <= FLOYD_LIMIT:
+                if self._all_pairs is None:
+                    self._all_pairs = floyd_warshall(self._weights)
+                dist, nxt = self._all_pairs
+                self._towards[fo] = dist[:, fo], nxt[:, fo]
+            else:
+                # Dijkstra from fo over reversed edges, the previous node there is the next one here
+                nxt, dist = self._search(fo, None, False, weights=self._weights.T)
+                nxt[fo] = fo
+                self._towards[fo] = dist, nxt
+        return self._towards[fo]
+
+    @staticmethod
+    def _follow(fi, fo, nxt):
+        path = [fi]
+        while path[-1] != fo:
+            path.append(int(nxt[path[-1]]))
+        return path
+
+    def _search(self, fi, fo, prune, estimate=None, weights=None):
+        """Previous node and cost arrays, nodes are settled in cost order until fo (all nodes if fo is None)"""
+        weights = self._weights if weights is None else weights
+        inf = float("inf")
+        size = len(weights)
+        prev = np.full(size, -1)
+        cost = np.full(size, inf)
+        cost[fi] = 0.0
+        visited = np.zeros(size, dtype=bool)
+        heap = [(estimate[fi] if estimate else 0.0, fi)]
+        while heap:
+            _, root = heapq.heappop(heap)
+            if visited[root]:
+                continue
+            visited[root] = True
+            if root == fo:
+                break
+            row = weights[root]
+            neighbors = ~visited & (row < inf)
+            if prune:
+                midw = row[neighbors].sum() / max(float(np.count_nonzero(neighbors)), 1.0)
+                neighbors &= row < midw
+                if root == fi:
+                    neighbors[fo] = False
+            costs = cost[root] + row
+            for nb in np.flatnonzero(neighbors & (costs < cost)).tolist():
+                cost[nb] = costs[nb]
+                prev[nb] = root
+                heapq.heappush(heap, (cost[nb] + estimate[nb] if estimate else cost[nb], nb))
+        return prev, cost
+
+    @staticmethod
+    def euclidean_heuristic(scale=1.0):
+        """A* heuristic for weights of at least scale * distance"""
+        return EuclideanHeuristic(scale)
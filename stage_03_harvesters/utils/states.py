@@ -1,11 +1,17 @@
 import math
 import random
+import time
+from collections import defaultdict
 
+import numpy as np
 from astrobox.cargo import CargoTransition
 
 from robogame_engine.geometry import Point, Vector
 from robogame_engine.theme import theme
 
+from spatial import per_tick
+from world import coords, pairwise, world_view
+
 
 def get_point_on_way_to(unit, target, at_distance=None):
     if at_distance is None:
@@ -16,11 +22,57 @@ def get_point_on_way_to(unit, target, at_distance=None):
     return Point(unit.x + va.x + vb.x, unit.y + va.y + vb.y)
 
 
+class TickSnapshot(object):
+    # What transition guards of a team read, computed once per tick
+    def __init__(self, scene, team):
+        view = world_view(scene)
+        self.sources = view.asteroids + view.dead_enemy_motherships(team) + view.dead_drones
+        self.has_sources = view.has_elerium_for(team)
+
+
+def tick_snapshot(scene, team):
+    return per_tick(scene, ('fsm_snapshot', team), lambda s: TickSnapshot(s, team))
+
+
+class EnemyHeadings(object):
+    # Which targets have an enemy drone nearby flying straight at them (within 1 degree).
+    # Checked for all given targets against all enemies at once, positions and headings as of the first call in a tick
+    def __init__(self, scene, team, targets=()):
+        enemies = world_view(scene).enemies(team)
+        self._xy = coords(enemies)
+        self._direction = np.array([drone.direction for drone in enemies], dtype=float)
+        self._targeted = {}
+        self.check(targets)
+
+    def check(self, targets):
+        targets = [target for target in targets if id(target) not in self._targeted]
+        if not targets:
+            return
+        xy = coords(targets)
+        dx = xy[:, 0, None] - self._xy[None, :, 0]
+        dy = xy[:, 1, None] - self._xy[None, :, 1]
+        heading = np.where((dx == 0) & (dy == 0), 90.0, np.degrees(np.arctan2(dy, dx)) % 360.0)
+        near = pairwise(xy, self._xy) < theme.CARGO_TRANSITION_DISTANCE * 4.0
+        going = near & (np.abs(self._direction[None, :] - heading) < (math.pi / 180.0))  # 1 degree
+        for target, targeted in zip(targets, going.any(axis=1).tolist()):
+            self._targeted[id(target)] = targeted
+
+    def is_targeted(self, target):
+        self.check([target])
+        return self._targeted[id(target)]
+
+
 class DroneState(object):
     def __init__(self, strategy):
         assert (strategy is not None)
         self.__strategy = strategy
+        self.reset()
+
+    def reset(self):
+        # Called on every entry to the state: StateMachine reuses state objects
         self._ttl = 0
+        self._look_ahead = None
+        self._look_ahead_inputs = None
 
     @property
     def strategy(self):
@@ -40,13 +92,28 @@ class DroneState(object):
     def game_step(self):
         self._ttl = self._ttl + 1
 
+    def look_ahead(self, kind):
+        """
+        Target to turn to while a cargo transition runs: the next harvest ('harvest') or unload ('unload') target.
+        It is picked when the transition starts and again only when strategy.target_inputs(kind) changes.
+        """
+        inputs = self.strategy.target_inputs(kind)
+        if self._look_ahead is None or inputs != self._look_ahead_inputs:
+            self._look_ahead_inputs = inputs
+            if kind == 'harvest':
+                target = self.strategy.get_harvest_target()
+            else:
+                target = self.strategy.get_unload_target()
+            self._look_ahead = target if target is not None else self.unit.mothership
+        return self._look_ahead
+
+    @property
+    def snapshot(self):
+        return tick_snapshot(self.scene, self.unit.team)
+
     def sources(self):
-        _sources = self.scene.asteroids
-        _sources = _sources + [m for m in self.unit.scene.motherships
-                               if not m.is_alive and m.team != self.unit.team]
-        _sources = _sources + [d for d in self.unit.scene.drones if not d.is_alive]
-        has_sources = len([s for s in _sources if s.cargo.payload > 0]) > 0
-        return has_sources, _sources
+        snapshot = self.snapshot
+        return snapshot.has_sources, snapshot.sources
 
 
 class DroneStateNone(DroneState):
@@ -55,9 +122,6 @@ class DroneStateNone(DroneState):
 
 
 class DroneStateIdle(DroneState):
-    def __init__(self, strategy):
-        super(self.__class__, self).__init__(strategy)
-
     def make_transition(self):
         if not self.unit.is_alive:
             return DroneStateNone
@@ -79,21 +143,26 @@ class DroneStateIdle(DroneState):
 
 
 class DroneStateUnload(DroneState):
-    def __init__(self, strategy):
+    def reset(self):
+        super(DroneStateUnload, self).reset()
         self._target = None
+        self._target_point = None
         self._target_cargo = None
         self._transition = None
-        super(DroneStateUnload, self).__init__(strategy)
 
     def has_any_enemy_going_harvest(self):
         if not self._target_point:
             return False
-        enemy_drones = [d for d in self.unit.scene.drones if d.team != self.unit.team and d.is_alive and
-                        d.distance_to(self._target) < theme.CARGO_TRANSITION_DISTANCE * 4.0 and
-                        math.fabs(d.direction - Vector.from_points(
-                            d.coord, self._target.coord.copy()
-                        ).direction) < (math.pi / 180.0)]  # 1 degree
-        return len(enemy_drones) > 0
+        team = self.unit.team
+        headings = per_tick(self.scene, ('enemy_headings', team),
+                            lambda scene: EnemyHeadings(scene, team, self.unloading_targets()))
+        return headings.is_targeted(self._target)
+
+    def unloading_targets(self):
+        # Targets of all drones of the team that unload right now
+        states = [drone.fsm_state for drone in self.strategy.data._drones]
+        return [state._target for state in states
+                if isinstance(state, DroneStateUnload) and state._transition and state._target_point]
 
     def make_transition(self):
         # if self.unit.health < 0.6 and self.unit.distance_to(self.unit.mothership) > theme.MOTHERSHIP_HEALING_DISTANCE:
@@ -116,21 +185,18 @@ class DroneStateUnload(DroneState):
             self._target = target
             self._target_point = get_point_on_way_to(self.unit, target, theme.CARGO_TRANSITION_DISTANCE * 0.9)
             self._target_cargo = target.cargo
-            self.strategy.data._targets[self.unit.id] = self._target_point
+            self.strategy.data.set_target(self.unit, self._target_point)
             self.unit.move_at(self._target_point)
         if self._transition:
             self._transition.game_step()
-            target = self.strategy.get_harvest_target()
-            if target is None:
-                target = self.unit.mothership
-            self.unit.turn_to(target)
+            self.unit.turn_to(self.look_ahead('harvest'))
         elif self.unit.distance_to(self._target_point) <= 1.0:
             self._transition = CargoTransition(cargo_from=self.unit.cargo, cargo_to=self._target_cargo)
 
 
 class DroneStateHarvest(DroneState):
-    def __init__(self, strategy):
-        super(DroneStateHarvest, self).__init__(strategy)
+    def reset(self):
+        super(DroneStateHarvest, self).reset()
         self._target = None
         self._target_cargo = None
         self._transition = None
@@ -139,10 +205,9 @@ class DroneStateHarvest(DroneState):
         if self.unit.cargo.is_full:
             return DroneStateUnload
         if self._target:
-            hglob = [self.strategy.data._drones[t] for t in self.strategy.data._targets
-                     if self.strategy.data._targets[t] == self._target]
+            hglob = self.strategy.data.targeting(self._target)
             if len(hglob) > 1:
-                hglob.sort(key=lambda u: u.fullness)
+                hglob.sort(key=lambda u: u.cargo.fullness)
                 reqsz = self._target_cargo.payload
                 for n, h in enumerate(hglob):
                     reqsz = reqsz - self.unit.cargo.free_space
@@ -165,18 +230,11 @@ class DroneStateHarvest(DroneState):
         # TODO: harvest any possible targets on the way to self._target
         if self._transition:
             self._transition.game_step()
-            target = self.strategy.get_unload_target()
-            if target:
-                self.unit.turn_to(target)
-            else:
-                self.unit.turn_to(self.unit.mothership)
+            self.unit.turn_to(self.look_ahead('unload'))
         if self._target is None:
-            target = self.strategy.get_harvest_target()
+            target = self.strategy.get_harvest_target(assign=True)
             if target is not None:
-                self._target = get_point_on_way_to(self.unit, target, theme.CARGO_TRANSITION_DISTANCE * 0.9)
-                self._target_cargo = target.cargo
-                self.unit.move_at(self._target.copy())
-                self.strategy.data._targets[self.unit.id] = target
+                self.retarget(target)
             elif self._transition is not None:
                 return
         if self._transition is None and self._target and int(self.unit.distance_to(self._target)) <= 1:
@@ -185,10 +243,19 @@ class DroneStateHarvest(DroneState):
             self._transition = CargoTransition(cargo_from=self._target_cargo, cargo_to=self.unit.cargo)
 
 
-class DroneStateAttack(DroneState):
-    def __init__(self, strategy):
-        super(DroneStateAttack, self).__init__(strategy)
+    @property
+    def is_reassignable(self):
+        # Flying to the source, not loading yet: the team may give it another one
+        return self._target is not None and self._transition is None
 
+    def retarget(self, target):
+        self._target = get_point_on_way_to(self.unit, target, theme.CARGO_TRANSITION_DISTANCE * 0.9)
+        self._target_cargo = target.cargo
+        self.unit.move_at(self._target.copy())
+        self.strategy.data.set_target(self.unit, target)
+
+
+class DroneStateAttack(DroneState):
     def make_transition(self):
         # if self.unit.health < 0.6 and self.unit.distance_to(self.unit.mothership) > theme.MOTHERSHIP_HEALING_DISTANCE:
         #     return DroneStateRunout
@@ -198,8 +265,8 @@ class DroneStateAttack(DroneState):
 
 
 class DroneStateRunout(DroneState):
-    def __init__(self, strategy):
-        super(DroneStateRunout, self).__init__(strategy)
+    def reset(self):
+        super(DroneStateRunout, self).reset()
         self._target = None
         self._directions = [-25, 25]
         random.shuffle(self._directions)
@@ -225,3 +292,75 @@ class DroneStateRunout(DroneState):
             self.unit.move_at(self._target)
         elif self.unit.distance_to(self._target) <= 1.0:
             self._target = None
+
+
+# Where each state can go, make_transition picks one of these or stays
+TRANSITIONS = {
+    DroneStateNone: (),
+    DroneStateIdle: (DroneStateNone, DroneStateHarvest, DroneStateUnload),
+    DroneStateUnload: (DroneStateIdle, DroneStateHarvest),
+    DroneStateHarvest: (DroneStateIdle, DroneStateUnload),
+    DroneStateAttack: (DroneStateIdle,),
+    DroneStateRunout: (),
+}
+
+
+class StateStats(object):
+    # Where the drones of a team spend their time: ticks and seconds of game_step per state, transitions
+    # and the transitions refused because TRANSITIONS doesn't list them
+    def __init__(self):
+        self.ticks = defaultdict(int)
+        self.seconds = defaultdict(float)
+        self.transitions = defaultdict(int)
+        self.refused = defaultdict(int)
+
+    def report(self):
+        lines = ['{:<20}{:>8} ticks {:>10.3f} s'.format(state.__name__, self.ticks[state], self.seconds[state])
+                 for state in sorted(self.ticks, key=lambda state: -self.seconds[state])]
+        lines += ['{} -> {}: {}'.format(source.__name__, target.__name__, count)
+                  for (source, target), count in sorted(self.transitions.items(), key=lambda item: -item[1])]
+        lines += ['refused {} -> {}: {}'.format(source.__name__, target.__name__, count)
+                  for (source, target), count in sorted(self.refused.items(), key=lambda item: -item[1])]
+        return '\n'.join(lines)
+
+
+class StateMachine(object):
+    """
+    FSM of a drone. Each state object is created once per drone and reset when the drone enters it again.
+    """
+
+    def __init__(self, strategy, initial, stats=None):
+        self.strategy = strategy
+        self.stats = stats if stats is not None else StateStats()
+        self._pool = {}
+        self.state = None
+        self.enter(initial)
+
+    def enter(self, state_class):
+        """Enter state_class. A transition missing from TRANSITIONS is counted in stats and the FSM stays put."""
+        if self.state is not None:
+            if state_class not in TRANSITIONS[self.state.__class__]:
+                self.stats.refused[(self.state.__class__, state_class)] += 1
+                return self.state
+            self.stats.transitions[(self.state.__class__, state_class)] += 1
+        state = self._pool.get(state_class)
+        if state is None:
+            state = self._pool[state_class] = state_class(self.strategy)
+        else:
+            state.reset()
+        self.state = state
+        return state
+
+    def update(self):
+        """Follow the guards of the current state, True if the state changed"""
+        state_class = self.state.make_transition()
+        if state_class is self.state.__class__:
+            return False
+        return self.enter(state_class).__class__ is state_class
+
+    def game_step(self):
+        state = self.state
+        started = time.perf_counter()
+        state.game_step()
+        self.stats.ticks[state.__class__] += 1
+        self.stats.seconds[state.__class__] += time.perf_counter() - started
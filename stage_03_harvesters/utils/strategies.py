@@ -7,6 +7,9 @@ from robogame_engine.theme import theme
 from astrobox.cargo import CargoTransition
 from astrobox.core import Drone, Unit, MotherShip
 
+from spatial import asteroid_tree
+from world import world_view
+
 
 class Strategy(object):
     def __init__(self, unit=None, id=None, group=None, is_group_unique=False):
@@ -190,18 +193,16 @@ class StrategyHarvesting(Strategy):
         return ""
 
     def get_nearest_elerium_stock(self):
-        elerium_stocks = [asteriod for asteriod in self.unit.scene.asteroids if asteriod.cargo.payload > 0]
-        elerium_stocks += [drone for drone in self.unit.scene.drones if not drone.is_alive and drone.cargo.payload > 0]
-        for drone in self.unit.teammates:
-            if drone.elerium_stock is not None and \
-                    not drone.cargo.is_full and \
-                    drone.elerium_stock in elerium_stocks:
-                elerium_stocks.remove(drone.elerium_stock)
+        taken_stocks = set(drone.elerium_stock for drone in self.unit.teammates
+                           if drone.elerium_stock is not None and not drone.cargo.is_full)
+        elerium_stocks = asteroid_tree(self.unit.scene).nearest(self.unit,
+                                                                predicate=lambda asteroid: asteroid not in taken_stocks)
+        elerium_stocks += [drone for drone in world_view(self.unit.scene).dead_drones_with_elerium
+                           if drone not in taken_stocks]
 
         if not elerium_stocks:
             return None
-        elerium_stocks = sorted(elerium_stocks, key=lambda x: x.distance_to(self.unit))
-        return elerium_stocks[0]
+        return min(elerium_stocks, key=lambda x: x.distance_to(self.unit))
 
     def game_step(self):
         # Даем возможность переопределять выбор источника elerium'а
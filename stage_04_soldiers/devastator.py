@@ -8,6 +8,12 @@ from robogame_engine import GameObject
 from robogame_engine.geometry import Point, Vector, normalise_angle
 from robogame_engine.theme import theme
 
+from assignment import FORBIDDEN, min_cost_assignment
+from spatial import asteroid_tree, unit_grid
+from world import distances_from, world_view
+
+PURPOSE_CANDIDATES = 5  # ближайших астероидов сборщика в назначении по команде
+
 
 class Headquarters:
     """
@@ -126,7 +132,13 @@ class Headquarters:
             soldier.role.change_role()
 
     def get_enemies_by_base(self, base, nearest=True):
-        enemies = self.get_enemies(base)
+        if nearest:
+            enemies = [drone for drone in unit_grid(base.scene).in_radius(base, MOTHERSHIP_HEALING_DISTANCE * 2)
+                       if base.team != drone.team and drone.is_alive]
+            enemies = list(zip(enemies, distances_from(base, enemies)))
+            enemies.sort(key=lambda x: x[1])
+        else:
+            enemies = self.get_enemies(base)
         result = []
         for enemy in enemies:
             if enemy[1] < MOTHERSHIP_HEALING_DISTANCE * 2 or not nearest:
@@ -134,14 +146,19 @@ class Headquarters:
         return result
 
     def get_enemies(self, soldier):
-        enemies = [(drone, soldier.distance_to(drone)) for drone in soldier.scene.drones if
-                   soldier.team != drone.team and drone.is_alive]
+        enemies = world_view(soldier.scene).enemies(soldier.team)
+        enemies = list(zip(enemies, distances_from(soldier, enemies)))
         enemies.sort(key=lambda x: x[1])
         return enemies
 
+    def get_nearest_enemy(self, soldier):
+        enemies = unit_grid(soldier.scene).nearest(soldier, predicate=lambda drone: soldier.team != drone.team
+                                                   and drone.is_alive)
+        return enemies[0] if enemies else None
+
     def get_bases(self, soldier):
-        bases = [(base, soldier.distance_to(base)) for base in soldier.scene.motherships if
-                 base.team != soldier.team and base.is_alive]
+        bases = [base for base in soldier.scene.motherships if base.team != soldier.team and base.is_alive]
+        bases = list(zip(bases, distances_from(soldier, bases)))
         bases.sort(key=lambda x: x[1])
         return bases
 
@@ -150,6 +167,55 @@ class Headquarters:
             idx = self.asteroids_in_work.index(item)
             self.asteroids_in_work.pop(idx)
 
+    def is_reassignable(self, soldier):
+        """Сборщик летит к источнику и еще не начал грузиться - источник можно поменять"""
+        actions = soldier.actions
+        return (soldier.is_alive and type(soldier.role) is Collector and len(actions) >= 3 and
+                actions[0][0] == 'move' and actions[0][2] == 0 and
+                actions[1][0] == 'load' and actions[1][1] is actions[0][1] and actions[2][0] == 'it is free')
+
+    def assign_purpose(self, soldier, candidates):
+        """
+        Источник для soldier из назначения с минимальной суммарной стоимостью.
+
+        В назначении soldier и сборщики, которые еще летят к своим источникам; источники - candidates
+        и текущие источники этих сборщиков. Стоимость - путь дрон -> источник -> база, источник
+        с элериумом меньше свободного места в трюме дрону не назначается (кроме его текущего),
+        прежний источник soldier ему не назначается. Сборщики, которым достался другой источник,
+        перенаправляются, только если soldier что-то достается.
+        """
+        soldiers = [soldier] + [other for other in self.soldiers
+                                if other is not soldier and self.is_reassignable(other)]
+        current = [other.actions[0][1] for other in soldiers[1:]]
+        purposes = [candidate for candidate in candidates if all(candidate is not target for target in current)]
+        purposes += current
+        if not purposes:
+            return None
+
+        costs = []
+        for row, drone in enumerate(soldiers):
+            own = current[row - 1] if row else None
+            banned = None if row else soldier.old_asteroid
+            costs.append([to_purpose + to_basa if purpose is not banned
+                          and (purpose is own or purpose.payload >= drone.free_space) else FORBIDDEN
+                          for purpose, to_purpose, to_basa in zip(purposes, distances_from(drone, purposes),
+                                                                  distances_from(drone.basa, purposes))])
+        assigned = min_cost_assignment(costs)
+        if assigned[0] is None:
+            return None
+        for other, target, column in zip(soldiers[1:], current, assigned[1:]):
+            if column is not None and purposes[column] is not target:
+                self.redirect(other, target, purposes[column])
+        return purposes[assigned[0]]
+
+    def redirect(self, soldier, old_purpose, purpose):
+        """Перенаправить летящего сборщика на другой источник"""
+        self.remove_item_asteroids_in_work(old_purpose)
+        self.asteroids_in_work.append(purpose)
+        for action in soldier.actions[:3]:
+            action[1] = purpose
+        soldier.move_to(purpose)
+
     def get_place_for_attack(self, soldier, target):
         """
         Выбор места для атаки цели, если цель не в радиусе атаки
@@ -239,9 +305,8 @@ class DevastatorDrone(Drone):
         self.limit_health = uniform(0.3, 0.5)
 
         if isinstance(self.role, Transport):
-            candidats_asteroids_for_basa = min([(asteroid.distance_to(self.my_mothership), asteroid)
-                                                for asteroid in self.asteroids if
-                                                asteroid not in self.asteroids_for_basa])
+            candidats = [asteroid for asteroid in self.asteroids if asteroid not in self.asteroids_for_basa]
+            candidats_asteroids_for_basa = min(zip(distances_from(self.my_mothership, candidats), candidats))
 
             candidat_basa = candidats_asteroids_for_basa[1]
             self.add_basa(candidat_basa)
@@ -360,14 +425,16 @@ class DevastatorDrone(Drone):
         """
         # TODO - на линии огня не проанализирвать, т.к. не ясно где цель
 
-        is_valide = 0 < point.x < theme.FIELD_WIDTH and 0 < point.y < theme.FIELD_HEIGHT
-        for partner in self.headquarters.soldiers:
-            if not partner.is_alive or partner is self:
+        if not (0 < point.x < theme.FIELD_WIDTH and 0 < point.y < theme.FIELD_HEIGHT):
+            return False
+        for partner in unit_grid(self.scene).in_radius(point, self.save_distance):
+            if not partner.is_alive or partner is self or partner not in self.headquarters.soldiers:
                 continue
 
-            is_valide = is_valide and (partner.distance_to(point) >= self.save_distance)
+            if partner.distance_to(point) < self.save_distance:
+                return False
 
-        return is_valide
+        return True
 
     @property
     def save_distance(self):
@@ -402,7 +469,7 @@ class DevastatorDrone(Drone):
     # callbacks:
     def on_born(self):
         self.born_soldier()
-        nearesst_aster = [(self.distance_to(aster), aster) for aster in self.asteroids]
+        nearesst_aster = list(zip(distances_from(self, self.asteroids), self.asteroids))
         nearesst_aster.sort(key=lambda x: x[0])
         idx = len(self.headquarters.soldiers) - 1
         if self.have_gun:
@@ -460,9 +527,10 @@ class Collector(Behavior):
             return self.unit.basa
 
         headquarters = self.unit.headquarters
+        view = world_view(self.unit.scene)
         forbidden_asteroids = list(headquarters.asteroids_in_work)
         if isinstance(self, Transport):
-            asteroids = [asteroid for asteroid in self.unit.scene.asteroids if asteroid not in forbidden_asteroids]
+            asteroids = [asteroid for asteroid in view.asteroids if asteroid not in forbidden_asteroids]
             free_elerium = sum([asteroid.payload for asteroid in asteroids])
             if free_elerium < 2000:
                 headquarters.asteroids_for_basa = []
@@ -474,40 +542,52 @@ class Collector(Behavior):
         if not hasattr(self.unit.scene, "asteroids"):
             return None
 
-        asteroids = [asteroid for asteroid in self.unit.scene.asteroids if asteroid not in forbidden_asteroids]
-        asteroids.extend([mothership for mothership in self.unit.scene.motherships
-                          if not mothership.is_alive and not mothership.is_empty])
-        asteroids.extend([drone for drone in self.unit.scene.drones
-                          if not drone.is_alive and not drone.is_empty])
+        forbidden_asteroids = set(forbidden_asteroids)
+        wrecks = view.dead_motherships_with_elerium + view.dead_drones_with_elerium
 
-        first_purpose = self.find_nearest_purpose(asteroids=asteroids, threshold=self.unit.free_space)
+        first_purpose = self.find_nearest_purpose(wrecks=wrecks, forbidden_asteroids=forbidden_asteroids,
+                                                  threshold=self.unit.free_space)
         if first_purpose:
             return first_purpose
 
+        # назначение могло перенаправить сборщиков: берем занятые источники заново
+        forbidden_asteroids = set(headquarters.asteroids_in_work)
+        if isinstance(self, Transport):
+            forbidden_asteroids.update(headquarters.asteroids_for_basa)
+        asteroids = [asteroid for asteroid in view.asteroids if asteroid not in forbidden_asteroids]
+        asteroids.extend(wrecks)
         purposes = [(asteroid.payload, asteroid) for asteroid in asteroids if asteroid.payload > 0]
         if purposes:
             second_purpose = max(purposes, key=lambda x: x[0])
             return second_purpose[1]
         return None
 
-    def find_nearest_purpose(self, asteroids, threshold=1):
-        soldier = self.unit
-        purposes = [(soldier.distance_to(asteroid) + asteroid.distance_to(soldier.basa), asteroid)
-                    for asteroid in asteroids if
-                    asteroid.payload >= threshold]
+    def find_nearest_purpose(self, wrecks, forbidden_asteroids, threshold=1):
+        """
+        Источник для сборщика - из назначения по команде (Headquarters.assign_purpose),
+        для транспорта - с самым длинным путем дрон -> источник -> база
 
-        if purposes:
-            if isinstance(self, Transport):
-                purpose = max(purposes, key=lambda x: x[0])[1]
-            else:
-                purpose = min(purposes, key=lambda x: x[0])[1]
+        :param wrecks: сбитые дроны и базы с элериумом
+        :param forbidden_asteroids: астероиды, которые уже в работе
+        :param threshold: минимальный запас элериума в источнике
+        """
+        soldier = self.unit
+        if isinstance(self, Transport):
+            candidates = [asteroid for asteroid in world_view(soldier.scene).asteroids
+                          if asteroid not in forbidden_asteroids]
         else:
-            purpose = None
-
-        if purpose == soldier.old_asteroid:
-            purpose = None
-
-        return purpose
+            candidates = asteroid_tree(soldier.scene).nearest(
+                soldier, k=PURPOSE_CANDIDATES, predicate=lambda asteroid: asteroid.payload >= threshold
+                and asteroid not in forbidden_asteroids, via=soldier.basa, with_empty=threshold <= 0)
+        candidates = [asteroid for asteroid in candidates + wrecks
+                      if asteroid.payload >= threshold and asteroid is not soldier.old_asteroid]
+        if not isinstance(self, Transport):
+            return soldier.headquarters.assign_purpose(soldier, candidates)
+        if candidates:
+            purposes = [(to_purpose + to_basa, asteroid) for to_purpose, to_basa, asteroid in
+                        zip(distances_from(soldier, candidates), distances_from(soldier.basa, candidates), candidates)]
+            return max(purposes, key=lambda x: x[0])[1]
+        return None
 
     def next_step(self, purpose):
         soldier = self.unit
@@ -598,9 +678,9 @@ class CombatBot(Defender):
             return self.victim
 
         soldier = self.unit
-        enemies = soldier.headquarters.get_enemies(soldier)
-        if enemies:
-            self.victim = enemies[0][0]
+        enemy = soldier.headquarters.get_nearest_enemy(soldier)
+        if enemy:
+            self.victim = enemy
             return self.victim
 
         self.victim = None
@@ -674,11 +754,7 @@ class Turel(Defender):
 
     def next_purpose(self):
         soldier = self.unit
-        enemies = soldier.headquarters.get_enemies(soldier)
-        if enemies:
-            return enemies[0][0]
-
-        return None
+        return soldier.headquarters.get_nearest_enemy(soldier)
 
     def next_step(self, target):
         soldier = self.unit
@@ -9,14 +9,16 @@ from stage_04_soldiers.devastator import DevastatorDrone
 from vader import VaderDrone
 
 NUMBER_OF_DRONES = 5
+TEAMS = (VaderDrone, ReaperDrone, DrillerDrone, DevastatorDrone)
+SCENE_SETTINGS = dict(
+    field=(900, 900),
+    speed=5,
+    asteroids_count=27,
+    can_fight=True,
+)
 
 if __name__ == '__main__':
-    scene = SpaceField(
-        field=(900, 900),
-        speed=5,
-        asteroids_count=27,
-        can_fight=True,
-    )
+    scene = SpaceField(**SCENE_SETTINGS)
 
     team_1 = [VaderDrone() for _ in range(NUMBER_OF_DRONES)]
     team_2 = [ReaperDrone() for _ in range(NUMBER_OF_DRONES)]
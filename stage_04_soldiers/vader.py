@@ -2,6 +2,8 @@
 
 from astrobox.core import Drone
 
+from spatial import asteroid_tree
+
 
 class VaderDrone(Drone):
     my_team = []
@@ -12,11 +14,11 @@ class VaderDrone(Drone):
         self.my_team.append(self)
 
     def _get_my_asteroid(self):
-        asteroids_with_elerium = set(aster for aster in self.asteroids if aster.payload)
         asteroids_as_targets = set(drone.target for drone in self.my_team)
-        free_asteroids = asteroids_with_elerium - asteroids_as_targets
+        free_asteroids = asteroid_tree(self.scene).nearest(self,
+                                                           predicate=lambda aster: aster not in asteroids_as_targets)
         if free_asteroids:
-            return free_asteroids.pop()
+            return free_asteroids[0]
 
     def on_stop_at_asteroid(self, asteroid):
         self.load_from(asteroid)
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+Стресс-прогон: как растет стоимость ИИ за тик с количеством дронов и астероидов.
+
+Две развертки на FakeScene: по дронам в команде при фиксированном числе астероидов
+и по астероидам при фиксированном числе дронов. Для каждой команды строится график
+время команды за тик от размера и оценивается показатель роста (наклон в log-log).
+
+    python stress.py --drones 5,20,50,100,200,500 --asteroids 20,100,500,1000,2000,5000 --csv stress.csv
+"""
+import argparse
+import math
+from collections import defaultdict
+
+from fake_scene import FakeScene
+from game import TEAMS
+from profiler import TickProfiler
+
+DRONES = (5, 20, 50, 100, 200, 500)
+ASTEROIDS = (20, 100, 500, 1000, 2000, 5000)
+FIXED_DRONES = 5
+FIXED_ASTEROIDS = 100
+WARMUP_TICKS = 10
+TICKS = 20
+CHART_WIDTH = 50
+
+
+class StressPoint:
+    """Замер одного размера сцены"""
+
+    def __init__(self, drones, asteroids, team_ms, errors):
+        self.drones = drones
+        self.asteroids = asteroids
+        self.team_ms = team_ms  # среднее время команды за тик, мс
+        self.errors = errors
+
+
+def measure(drones, asteroids, ticks=TICKS, seed=0):
+    """Среднее время game_step каждой команды за тик на сцене заданного размера"""
+    scene = FakeScene(field=(1200, 900), asteroids_count=asteroids, can_fight=True, seed=seed, strict=False)
+    for drone_class in TEAMS:
+        scene.add_team(drone_class, drones)
+    scene.prepare()
+    with TickProfiler() as profiler:
+        scene.run(WARMUP_TICKS)
+        profiler.reset()
+        scene.run(ticks)
+    totals = defaultdict(float)
+    for (tick, team), seconds in profiler.per_team_tick().items():
+        totals[team] += seconds
+    team_ms = {team: seconds * 1000 / ticks for team, seconds in totals.items()}
+    return StressPoint(drones, asteroids, team_ms, dict(scene.errors))
+
+
+def sweep(drones_sizes, asteroids_sizes, ticks=TICKS, seed=0, fixed_drones=FIXED_DRONES,
+          fixed_asteroids=FIXED_ASTEROIDS):
+    """Развертки по дронам и по астероидам"""
+    by_drones = [measure(drones, fixed_asteroids, ticks=ticks, seed=seed) for drones in drones_sizes]
+    by_asteroids = [measure(fixed_drones, asteroids, ticks=ticks, seed=seed) for asteroids in asteroids_sizes]
+    return by_drones, by_asteroids
+
+
+def growth(points, size_of):
+    """Наклон log(время)/log(размер) между крайними точками: ~1 линейно, ~2 квадратично"""
+    slopes = {}
+    first, last = points[0], points[-1]
+    for team in last.team_ms:
+        before, after = first.team_ms.get(team), last.team_ms.get(team)
+        if before and after and size_of(last) != size_of(first):
+            slopes[team] = math.log(after / before) / math.log(float(size_of(last)) / size_of(first))
+    return slopes
+
+
+def chart(points, size_of, title):
+    """Текстовый график: по строке на размер, длина полосы - логарифм времени"""
+    lines = [title]
+    values = [ms for point in points for ms in point.team_ms.values() if ms > 0]
+    if not values:
+        return title
+    low, high = math.log10(min(values)), math.log10(max(values))
+    scale = CHART_WIDTH / max(high - low, 1e-9)
+    slopes = growth(points, size_of)
+    for team in TEAMS:
+        team = team.__name__
+        lines.append('  {} (growth ~N^{:.2f})'.format(team, slopes.get(team, float('nan'))))
+        for point in points:
+            ms = point.team_ms.get(team, 0.0)
+            bar = '#' * (1 + int((math.log10(ms) - low) * scale)) if ms > 0 else ''
+            errors = point.errors.get(team)
+            lines.append('    {:>6} {:<{width}} {:>10.2f} ms{}'.format(
+                size_of(point), bar, ms, ' ({} errors)'.format(errors) if errors else '', width=CHART_WIDTH + 1))
+    return '\n'.join(lines)
+
+
+def write_csv(path, by_drones, by_asteroids):
+    with open(path, 'w') as f:
+        f.write('sweep,drones,asteroids,team,ms_per_tick,errors\n')
+        for sweep_name, points in (('drones', by_drones), ('asteroids', by_asteroids)):
+            for point in points:
+                for team, ms in sorted(point.team_ms.items()):
+                    f.write('{},{},{},{},{:.4f},{}\n'.format(sweep_name, point.drones, point.asteroids, team, ms,
+                                                             point.errors.get(team, 0)))
+
+
+def parse_sizes(value):
+    return [int(size) for size in value.split(',') if size]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Стоимость ИИ за тик в зависимости от размера сцены')
+    parser.add_argument('--drones', type=parse_sizes, default=list(DRONES), help='дронов в команде, через запятую')
+    parser.add_argument('--asteroids', type=parse_sizes, default=list(ASTEROIDS), help='астероидов, через запятую')
+    parser.add_argument('--fixed-drones', type=int, default=FIXED_DRONES)
+    parser.add_argument('--fixed-asteroids', type=int, default=FIXED_ASTEROIDS)
+    parser.add_argument('--ticks', type=int, default=TICKS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--csv', help='записать замеры в CSV')
+    args = parser.parse_args()
+
+    by_drones, by_asteroids = sweep(args.drones, args.asteroids, ticks=args.ticks, seed=args.seed,
+                                    fixed_drones=args.fixed_drones, fixed_asteroids=args.fixed_asteroids)
+    print(chart(by_drones, lambda point: point.drones,
+                'ms per team tick vs drones per team ({} asteroids)'.format(args.fixed_asteroids)))
+    print()
+    print(chart(by_asteroids, lambda point: point.asteroids,
+                'ms per team tick vs asteroids ({} drones per team)'.format(args.fixed_drones)))
+    if args.csv:
+        write_csv(args.csv, by_drones, by_asteroids)
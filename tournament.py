@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Турнир: много матчей с разными seed, разложенных по процессам.
+
+    python tournament.py --matches 100 --workers 8 --max-ticks 6000
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from headless import MAX_TICKS, PRESETS, run_preset
+
+
+class TeamStanding:
+    """Сводная статистика команды по всем матчам турнира"""
+
+    def __init__(self, team):
+        self.team = team
+        self.matches = 0
+        self.wins = 0
+        self.elerium = 0
+        self.kills = 0
+        self.survivors = 0
+
+    def add(self, result, is_winner):
+        self.matches += 1
+        self.wins += int(is_winner)
+        self.elerium += result.elerium
+        self.kills += result.kills
+        self.survivors += result.alive
+
+    @property
+    def win_rate(self):
+        return self.wins / self.matches if self.matches else 0.0
+
+    @property
+    def mean_elerium(self):
+        return self.elerium / self.matches if self.matches else 0.0
+
+    @property
+    def mean_survivors(self):
+        return self.survivors / self.matches if self.matches else 0.0
+
+
+class Tournament:
+    """Слияние результатов матчей в одну таблицу"""
+
+    def __init__(self):
+        self.results = []
+        self.standings = {}
+        self.failures = []  # (seed, ошибка) матчей, которые упали
+
+    def fail(self, seed, error):
+        self.failures.append((seed, '{}: {}'.format(type(error).__name__, error)))
+
+    def add(self, match):
+        self.results.append(match)
+        winner = match.winner
+        for team, result in match.teams.items():
+            if team not in self.standings:
+                self.standings[team] = TeamStanding(team)
+            self.standings[team].add(result, team == winner)
+
+    @property
+    def total_steps(self):
+        return sum(match.steps for match in self.results)
+
+    def table(self):
+        lines = ['{:<20}{:>8}{:>8}{:>10}{:>8}{:>11}'.format(
+            'team', 'matches', 'win %', 'elerium', 'kills', 'survivors')]
+        for standing in sorted(self.standings.values(), key=lambda s: (-s.win_rate, -s.mean_elerium)):
+            lines.append('{:<20}{:>8}{:>8.1f}{:>10.1f}{:>8}{:>11.2f}'.format(
+                standing.team, standing.matches, standing.win_rate * 100, standing.mean_elerium,
+                standing.kills, standing.mean_survivors))
+        for seed, error in sorted(self.failures):
+            lines.append('seed {} failed: {}'.format(seed, error))
+        return '\n'.join(lines)
+
+
+def play(preset, seeds, max_ticks=MAX_TICKS, number_of_drones=5, workers=None):
+    """
+    Прогон матчей по списку seed в пуле процессов.
+    Каждый матч независим, поэтому пропускная способность растет с числом ядер.
+    Упавший матч записывается в failures и не мешает остальным.
+    """
+    tournament = Tournament()
+    seeds = list(seeds)
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_preset, preset, seed, max_ticks, number_of_drones): seed for seed in seeds}
+        for future in as_completed(futures):
+            try:
+                tournament.add(future.result())
+            except Exception as error:
+                tournament.fail(futures[future], error)
+    tournament.results.sort(key=lambda match: match.seed)
+    return tournament
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Турнир из нескольких матчей без отрисовки')
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='game')
+    parser.add_argument('--matches', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--seed', type=int, default=0, help='seed первого матча, остальные идут подряд')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--max-ticks', type=int, default=MAX_TICKS)
+    parser.add_argument('--drones', type=int, default=5)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    result = play(args.preset, range(args.seed, args.seed + args.matches), max_ticks=args.max_ticks,
+                  number_of_drones=args.drones, workers=args.workers)
+    elapsed = time.perf_counter() - started
+    print(result.table())
+    print('\n{} matches ({} failed), {} steps in {:.1f}s ({:.0f} ticks/s)'.format(
+        len(result.results), len(result.failures), result.total_steps, elapsed, result.total_steps / elapsed))
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Общие для всех команд сведения о мире, которые считаются раз за тик.
+
+DistanceMatrix держит координаты всех дронов, баз и астероидов в массивах NumPy
+и считает попарные расстояния векторно. ИИ команд спрашивает расстояния через
+distance/distances_from вместо distance_to: ответ тот же, но без тысяч скалярных
+вызовов robogame_engine.geometry за тик.
+
+WorldView - снимок сцены на тик: списки астероидов с элериумом, сбитых дронов и
+баз, живых врагов, которые иначе каждый дрон собирал бы себе заново.
+"""
+import weakref
+
+import numpy as np
+
+from spatial import per_tick
+
+STATIC_CAP = 2048  # при большем числе баз и астероидов их общий блок не считаем целиком
+
+
+def pairwise(xy_from, xy_to):
+    """Матрица расстояний между точками двух массивов (n, 2) и (m, 2)"""
+    dx = xy_from[:, 0, None] - xy_to[None, :, 0]
+    dy = xy_from[:, 1, None] - xy_to[None, :, 1]
+    return np.sqrt(dx * dx + dy * dy)
+
+
+def coords(objects):
+    return np.array([(obj.x, obj.y) for obj in objects], dtype=float).reshape(-1, 2)
+
+
+class StaticBlock:
+    """Базы и астероиды не двигаются: их координаты и расстояния между ними считаются один раз за матч"""
+
+    def __init__(self, objects):
+        self.objects = objects
+        self.xy = coords(objects)
+        self.block = pairwise(self.xy, self.xy) if len(objects) <= STATIC_CAP else None
+
+    def row(self, i):
+        if self.block is not None:
+            return self.block[i]
+        return pairwise(self.xy[i:i + 1], self.xy)[0]
+
+
+_static_blocks = weakref.WeakKeyDictionary()
+
+
+def static_block(scene):
+    statics = scene.motherships + scene.asteroids
+    block = _static_blocks.get(scene)
+    if block is None or len(block.objects) != len(statics):
+        block = _static_blocks[scene] = StaticBlock(statics)
+    return block
+
+
+class DistanceMatrix:
+    """
+    Расстояния между объектами сцены по положениям на начало тика.
+
+    Строки дронов считаются каждый тик одной векторной операцией, блок баз и
+    астероидов берется из StaticBlock. Если дрон успел сдвинуться после
+    построения матрицы, его расстояния считаются заново, так что distance всегда
+    совпадает с distance_to с точностью до округления в последнем знаке.
+    """
+
+    def __init__(self, scene):
+        self.movers = scene.drones
+        self.static = static_block(scene)
+        self.objects = self.movers + self.static.objects
+        self._index = {id(obj): i for i, obj in enumerate(self.objects)}
+        self._moved_from = [(drone.coord.x, drone.coord.y) for drone in self.movers]
+        mover_xy = coords(self.movers)
+        self._mover_rows = pairwise(mover_xy, np.concatenate([mover_xy, self.static.xy]))
+        self._rows = {}
+
+    def _fresh(self, obj):
+        """Индекс объекта в матрице или None, если его там нет или он сдвинулся"""
+        i = self._index.get(id(obj))
+        if i is not None and i < len(self._moved_from):
+            coord = obj.coord
+            if (coord.x, coord.y) != self._moved_from[i]:
+                return None
+        return i
+
+    def _row(self, i):
+        """Строка расстояний от i-го объекта до всех объектов, списком float"""
+        row = self._rows.get(i)
+        if row is None:
+            movers = len(self.movers)
+            if i < movers:
+                row = self._mover_rows[i]
+            else:
+                row = np.concatenate([self._mover_rows[:, i], self.static.row(i - movers)])
+            row = self._rows[i] = row.tolist()
+        return row
+
+    def distance(self, a, b):
+        """То же, что a.distance_to(b)"""
+        i = self._fresh(a)
+        j = self._fresh(b) if i is not None else None
+        if j is None:
+            return a.distance_to(b)
+        return self._row(i)[j]
+
+    def distances_from(self, a, objects):
+        """[a.distance_to(obj) for obj in objects]"""
+        i = self._fresh(a)
+        if i is None:
+            return [a.distance_to(obj) for obj in objects]
+        row = self._row(i)
+        result = []
+        for obj in objects:
+            j = self._fresh(obj)
+            result.append(row[j] if j is not None else a.distance_to(obj))
+        return result
+
+
+def distance_matrix(scene):
+    return per_tick(scene, 'distance_matrix', DistanceMatrix)
+
+
+def distance(a, b):
+    """a.distance_to(b), по возможности из матрицы текущего тика"""
+    scene = getattr(a, 'scene', None)
+    if scene is None:
+        return a.distance_to(b)
+    return distance_matrix(scene).distance(a, b)
+
+
+def distances_from(a, objects):
+    """Расстояния от a до каждого из objects, по возможности из матрицы текущего тика"""
+    scene = getattr(a, 'scene', None)
+    if scene is None:
+        return [a.distance_to(obj) for obj in objects]
+    return distance_matrix(scene).distances_from(a, objects)
+
+
+class WorldView:
+    """
+    Снимок мира на начало тика, общий для всех дронов всех команд.
+
+    Списки строятся при первом обращении за тик, а то, что зависит от команды
+    (враги, чужие сбитые базы), - один раз на команду. Загрузка и выгрузка внутри
+    тика снимок не меняют, поэтому то, что читается из него, может отставать от
+    сцены не больше чем на тик.
+    """
+
+    def __init__(self, scene):
+        self.drones = scene.drones
+        self.motherships = scene.motherships
+        self.asteroids = scene.asteroids
+        self.elerium_asteroids = [asteroid for asteroid in self.asteroids if not asteroid.cargo.is_empty]
+        self.dead_drones = [drone for drone in self.drones if not drone.is_alive]
+        self.dead_drones_with_elerium = [drone for drone in self.dead_drones if not drone.cargo.is_empty]
+        self.dead_motherships = [mothership for mothership in self.motherships if not mothership.is_alive]
+        self.dead_motherships_with_elerium = [mothership for mothership in self.dead_motherships
+                                              if not mothership.cargo.is_empty]
+        self._by_team = {}
+
+    def _for_team(self, name, team, factory):
+        key = (name, team)
+        if key not in self._by_team:
+            self._by_team[key] = factory()
+        return self._by_team[key]
+
+    def enemies(self, team):
+        """Живые дроны других команд"""
+        return self._for_team('enemies', team, lambda: [drone for drone in self.drones
+                                                        if drone.team != team and drone.is_alive])
+
+    def dead_enemy_motherships(self, team):
+        return self._for_team('dead_enemy_motherships', team, lambda: [mothership for mothership in
+                                                                       self.dead_motherships
+                                                                       if mothership.team != team])
+
+    def has_elerium_for(self, team):
+        """Есть ли элериум на астероидах, сбитых дронах и чужих сбитых базах"""
+        return self._for_team('has_elerium', team, lambda: bool(
+            self.elerium_asteroids or self.dead_drones_with_elerium or
+            any(mothership.team != team for mothership in self.dead_motherships_with_elerium)))
+
+
+def world_view(scene):
+    return per_tick(scene, 'world_view', WorldView)